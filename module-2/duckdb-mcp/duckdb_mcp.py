@@ -1,34 +1,641 @@
+import asyncio
 import duckdb
 import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 from mcp.server.fastmcp import FastMCP
 
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_CELL_CHARS = 1000
+MAX_OPEN_RESULTS = 16
+ARROW_BATCH_SIZE = 65_536
+RESULTS_DIR = os.environ.get("DUCKDB_MCP_RESULTS_DIR", "results")
+OUTPUT_FORMATS = ("arrow", "parquet")
+MAX_WORKERS = int(os.environ.get("DUCKDB_MCP_MAX_WORKERS", "8"))
+DATABASE = os.environ.get("DUCKDB_MCP_DATABASE", ":memory:")
+FILE_READERS = {"parquet": "read_parquet", "csv": "read_csv_auto"}
+FILE_SUFFIXES = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".csv": "csv",
+    ".tsv": "csv",
+    ".csv.gz": "csv",
+    ".tsv.gz": "csv",
+}
+SQLITE_HEADER = b"SQLite format 3\x00"
+CACHE_MAX_ENTRIES = int(os.environ.get("DUCKDB_MCP_CACHE_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("DUCKDB_MCP_CACHE_MB", "64")) * 2**20
+CACHE_TTL_S = float(os.environ.get("DUCKDB_MCP_CACHE_TTL_S", "300"))
+
+QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+VOLATILE = re.compile(
+    r"\b(random|uuid|gen_random_uuid|now|current_timestamp|current_date"
+    r"|current_time|get_current_timestamp|nextval)\b"
+)
+# the table or view a write statement changes, matched on normalized SQL
+WRITE_TARGET = re.compile(
+    r"^(?:insert(?: or \w+)? into|update|delete from|truncate(?: table)?|copy"
+    r"|(?:create|drop|alter)(?: or replace)?(?: temp| temporary)? (table|view)"
+    r"(?: if(?: not)? exists)?) ((?:\w+|\"[^\"]+\")(?:\.(?:\w+|\"[^\"]+\"))*)"
+)
+# state that only lives on the cursor of a single execute_sql call
+SESSION_STATE = re.compile(
+    r"^(?:use |set (?:schema|search_path)\b"
+    r"|create(?: or replace)? (?:temp|temporary) )"
+)
+TRANSACTION_START = re.compile(r"^(?:begin|start)\b")
+DDL_TYPES = {"CREATE", "DROP", "ALTER", "ATTACH", "DETACH"}
+CATALOG_SAMPLE_ROWS = 100
+CATALOG_SAMPLE_VALUES = 3
+
 mcp = FastMCP("DuckDB")
-conn = duckdb.connect(":memory:")
+conn = duckdb.connect(DATABASE)
+# queries run off the event loop, each on its own cursor of the shared database
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="duckdb")
 
 
-@mcp.tool()
-def execute_sql(sql: str) -> str:
-    """Executes a SQL query against the DuckDB database."""
+async def run_in_worker(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+def normalize_sql(sql: str) -> str:
+    parts = QUOTED.split(sql.strip().rstrip(";").strip())
+    # lowercase and collapse whitespace outside quoted literals and identifiers
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part).lower()
+        for i, part in enumerate(parts)
+    )
+
+
+class ResultCache:
+    """LRU cache of complete single-page responses, keyed by normalized SQL.
+
+    Entries remember the tables they read and are dropped when a statement
+    writes to one of them, on TTL expiry, or when the size limits are hit.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        # key -> (response, created, tables read)
+        self.entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        # bumped on every invalidation, so results computed before a write
+        # finished are not stored
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, key: tuple):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl_s:
+                self.remove(key)
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: tuple, response: str, tables: set, generation: int) -> None:
+        if len(response) > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (response, time.monotonic(), frozenset(tables))
+            self.bytes += len(response)
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def remove(self, key: tuple) -> None:
+        self.bytes -= len(self.entries.pop(key)[0])
+
+    def invalidate(self, tables, catalog: bool = False) -> None:
+        """Drops entries reading any of tables (all entries if tables is None).
+
+        catalog also drops entries that read no table, such as SHOW TABLES.
+        """
+        with self.lock:
+            self.generation += 1
+            stale = [
+                key
+                for key, (_, _, read) in self.entries.items()
+                if tables is None or read & tables or (catalog and not read)
+            ]
+            for key in stale:
+                self.remove(key)
+            self.stats["invalidations"] += len(stale)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+            }
+
+
+cache = ResultCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_S)
+
+
+class SchemaCatalog:
+    """Columns, row counts and sample values of every table, rebuilt after DDL.
+
+    Row counts are not refreshed by INSERT/UPDATE/DELETE.
+    """
+
+    def __init__(self):
+        self.value = None
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            return self.value
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.value = None
+            self.generation += 1
+
+    def build(self) -> str:
+        generation = self.generation
+        with conn.cursor() as cursor:
+            database = cursor.execute("SELECT current_database()").fetchone()[0]
+            tables = cursor.execute(
+                "SELECT table_catalog, table_schema, table_name, table_type "
+                "FROM information_schema.tables "
+                "WHERE table_schema NOT IN ('information_schema', 'pg_catalog') "
+                "ORDER BY ALL"
+            ).fetchall()
+            catalog = [self.describe(cursor, database, *table) for table in tables]
+        value = json.dumps({"tables": catalog}, default=str)
+        with self.lock:
+            if generation == self.generation:
+                self.value = value
+        return value
+
+    def describe(self, cursor, database, catalog, schema, table, table_type) -> dict:
+        # default database and schema are left out of the name, as in queries
+        parts = [catalog, schema, table]
+        if catalog == database:
+            parts = parts[2:] if schema == "main" else parts[1:]
+        name = ".".join(quote_identifier(part) for part in parts)
+        entry = {
+            "name": ".".join(
+                part
+                if re.fullmatch(r"[a-z_][a-z0-9_]*", part)
+                else quote_identifier(part)
+                for part in parts
+            ),
+            "type": table_type,
+        }
+        try:
+            entry["rows"] = cursor.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+            sample = cursor.execute(
+                f"SELECT * FROM {name} LIMIT {CATALOG_SAMPLE_ROWS}"
+            ).fetchall()
+            types = cursor.execute(f"DESCRIBE {name}").fetchall()
+        except duckdb.Error as e:
+            # e.g. a view over files that were moved, the rest of the catalog stays
+            entry["error"] = str(e)
+            return entry
+        entry["columns"] = [
+            [column, column_type, sample_values(row[i] for row in sample)]
+            for i, (column, column_type, *_) in enumerate(types)
+        ]
+        return entry
+
+
+def sample_values(values) -> list:
+    distinct = []
+    for value in values:
+        value = cell(value)
+        if value is not None and value not in distinct:
+            distinct.append(value)
+            if len(distinct) == CATALOG_SAMPLE_VALUES:
+                break
+    return distinct
+
+
+schema_catalog = SchemaCatalog()
+
+
+def invalidate_writes(statements) -> None:
+    for statement in statements:
+        kind = statement.type.name
+        if kind == "SELECT":
+            continue
+        if kind in DDL_TYPES:
+            schema_catalog.invalidate()
+        match = WRITE_TARGET.match(normalize_sql(statement.query))
+        if match is None or match.group(1) == "view":
+            # unknown effects, or views whose readers only list base tables
+            cache.invalidate(None)
+            continue
+        table = match.group(2).split(".")[-1].strip('"').lower()
+        cache.invalidate({table}, catalog=kind in DDL_TYPES)
+
+
+def read_tables(cursor: duckdb.DuckDBPyConnection, sql: str):
+    """Base tables a query reads, or None if DuckDB cannot tell."""
+    try:
+        return {table.lower() for table in cursor.get_table_names(sql)}
+    except duckdb.Error:
+        # some view queries fail to bind here, those are simply not cached
+        return None
+
+
+class PagedResult:
+    """A query result streamed from its own cursor one page at a time."""
+
+    def __init__(self, cursor: duckdb.DuckDBPyConnection):
+        self.cursor = cursor
+        self.columns = [column[0] for column in cursor.description or []]
+        self.offset = 0
+        self.lookahead = []
+        # one fetch at a time per cursor
+        self.lock = threading.Lock()
+
+    def fetch(self, page_size: int) -> dict:
+        with self.lock:
+            # read one row past the page to know if another page exists
+            rows = self.lookahead + self.cursor.fetchmany(
+                page_size + 1 - len(self.lookahead)
+            )
+            page, self.lookahead = rows[:page_size], rows[page_size:]
+            response = {
+                "columns": self.columns,
+                "rows": [[cell(value) for value in row] for row in page],
+                "offset": self.offset,
+                "has_more": bool(self.lookahead),
+            }
+            self.offset += len(page)
+        return response
+
+    def close(self) -> None:
+        with self.lock:
+            self.cursor.close()
+
+
+# open results, least recently used first
+results: "OrderedDict[str, PagedResult]" = OrderedDict()
+results_lock = threading.Lock()
+
+
+def cell(value):
+    # keep a single huge value from flooding the response
+    if isinstance(value, str) and len(value) > MAX_CELL_CHARS:
+        return value[:MAX_CELL_CHARS] + "..."
+    return value
+
+
+def clamp_page_size(page_size: int) -> int:
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def open_result(cursor: duckdb.DuckDBPyConnection) -> str:
+    result_id = uuid.uuid4().hex[:12]
+    with results_lock:
+        results[result_id] = PagedResult(cursor)
+        # abandoned results are closed once too many are open
+        evicted = [
+            results.popitem(last=False)[1]
+            for _ in range(len(results) - MAX_OPEN_RESULTS)
+        ]
+    for result in evicted:
+        result.close()
+    return result_id
+
+
+def pop_result(result_id: str):
+    with results_lock:
+        return results.pop(result_id, None)
+
+
+def fetch(result_id: str, page_size: int) -> str:
+    with results_lock:
+        result = results.get(result_id)
+        if result is None:
+            raise KeyError(f"unknown or exhausted result_id {result_id!r}")
+        results.move_to_end(result_id)
+    response = result.fetch(clamp_page_size(page_size))
+    if response["has_more"]:
+        response["result_id"] = result_id
+    elif pop_result(result_id) is not None:
+        result.close()
+    return json.dumps(response, default=str)
+
+
+def write_result_file(sql: str, output_format: str) -> str:
+    """Streams the full result to an Arrow IPC or Parquet file."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.abspath(
+        os.path.join(RESULTS_DIR, f"{uuid.uuid4().hex}.{output_format}")
+    )
+    cursor = conn.cursor()
+    try:
+        reader = cursor.execute(sql).fetch_record_batch(ARROW_BATCH_SIZE)
+        if output_format == "parquet":
+            writer = pq.ParquetWriter(path, reader.schema)
+        else:
+            writer = pa.ipc.new_file(path, reader.schema)
+        rows = 0
+        with writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    finally:
+        cursor.close()
+    return json.dumps(
+        {
+            "path": path,
+            "format": output_format,
+            "columns": reader.schema.names,
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+        }
+    )
+
+
+def check_session_state(statements) -> None:
+    # each call gets a fresh cursor, so this would be lost as soon as it returns;
+    # closing the cursor also silently rolls back a transaction left open
+    in_transaction = False
+    for statement in statements:
+        if statement.type.name == "TRANSACTION":
+            in_transaction = bool(
+                TRANSACTION_START.match(normalize_sql(statement.query))
+            )
+    if in_transaction or (
+        statements and SESSION_STATE.match(normalize_sql(statements[-1].query))
+    ):
+        raise ValueError(
+            "Transactions, TEMP objects, USE and SET schema/search_path only "
+            "last for one execute_sql call; run them in the same call as the "
+            "queries that need them and end transactions with COMMIT, or use "
+            "regular tables and qualified names"
+        )
+
+
+def run_sql(sql: str, page_size: int, output_format: str) -> str:
     try:
-        result = conn.execute(sql).fetchall()
-        return json.dumps(result)
+        cursor = conn.cursor()
+        statements = cursor.extract_statements(sql)
+        check_session_state(statements)
+        reads = all(statement.type.name == "SELECT" for statement in statements)
+        if output_format != "json":
+            if output_format not in OUTPUT_FORMATS:
+                return f"Error executing SQL: unknown output_format {output_format!r}"
+            try:
+                return write_result_file(sql, output_format)
+            finally:
+                if not reads:
+                    invalidate_writes(statements)
+
+        key = (normalize_sql(sql), clamp_page_size(page_size))
+        tables = None
+        if reads and len(statements) == 1 and not VOLATILE.search(key[0]):
+            tables = read_tables(cursor, sql)
+
+        generation = cache.generation
+        try:
+            cursor.execute(sql)
+        finally:
+            if not reads:
+                invalidate_writes(statements)
+        response = fetch(open_result(cursor), page_size)
+        if tables is not None and '"result_id"' not in response:
+            cache.put(key, response, tables, generation)
+        return response
     except Exception as e:
         return f"Error executing SQL: {str(e)}"
 
 
-@mcp.tool()
-def get_tables() -> str:
-    """Retrieves the list of tables in the DuckDB database."""
+def run_fetch_page(result_id: str, page_size: int) -> str:
+    try:
+        return fetch(result_id, page_size)
+    except Exception as e:
+        pop_result(result_id)
+        return f"Error fetching page: {str(e)}"
+
+
+def list_tables() -> str:
     try:
-        tables = conn.execute("SHOW TABLES;").fetchall()
+        with conn.cursor() as cursor:
+            tables = cursor.execute(
+                "SELECT table_catalog, table_schema, table_name, table_type "
+                "FROM information_schema.tables "
+                "WHERE table_schema NOT IN ('information_schema', 'pg_catalog') "
+                "ORDER BY ALL"
+            ).fetchall()
         return json.dumps(tables)
     except Exception as e:
         return f"Error retrieving tables: {str(e)}"
 
 
-# Example: Create a sample table for testing
-conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER, name VARCHAR);")
-conn.execute("INSERT INTO users VALUES (1, 'Alice'), (2, 'Bob');")
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def local_path(path: str) -> str:
+    # views keep working when the server is started from another directory
+    if "://" in path:
+        return path
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def register_view(name: str, path: str, file_format: str = "auto") -> dict:
+    """Creates a view over Parquet or CSV files, which are scanned in place."""
+    if file_format == "auto":
+        suffix = next(
+            (suffix for suffix in FILE_SUFFIXES if path.lower().endswith(suffix)), None
+        )
+        if suffix is None:
+            raise ValueError(f"cannot infer the format of {path!r}, pass file_format")
+        file_format = FILE_SUFFIXES[suffix]
+    reader = FILE_READERS[file_format]
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE OR REPLACE VIEW {quote_identifier(name)} AS "
+            f"SELECT * FROM {reader}({quote_literal(local_path(path))})"
+        )
+        columns = cursor.execute(f"DESCRIBE {quote_identifier(name)}").fetchall()
+    cache.invalidate(None)
+    schema_catalog.invalidate()
+    return {"view": name, "reader": reader, "columns": [row[:2] for row in columns]}
+
+
+def attach(path: str, alias: str, read_only: bool = True) -> dict:
+    """Attaches a SQLite or DuckDB file as a database named alias."""
+    path = local_path(path)
+    kind = "DUCKDB"
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                kind = "SQLITE"
+    options = f"TYPE {kind}" + (", READ_ONLY" if read_only else "")
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"ATTACH {quote_literal(path)} AS {quote_identifier(alias)} ({options})"
+        )
+        tables = cursor.execute(
+            "SELECT table_schema, table_name FROM information_schema.tables "
+            "WHERE table_catalog = ? ORDER BY ALL",
+            [alias],
+        ).fetchall()
+    cache.invalidate(None)
+    schema_catalog.invalidate()
+    return {"database": alias, "type": kind.lower(), "tables": tables}
+
+
+def parse_sources(spec: str) -> List[Tuple[str, str]]:
+    # "name=path;name=path", as used by DUCKDB_MCP_VIEWS and DUCKDB_MCP_ATTACH
+    return [
+        tuple(item.strip().split("=", 1)) for item in spec.split(";") if item.strip()
+    ]
+
+
+def run_register_files(name: str, path: str, file_format: str) -> str:
+    try:
+        return json.dumps(register_view(name, path, file_format))
+    except Exception as e:
+        return f"Error registering files: {str(e)}"
+
+
+def run_attach_database(path: str, alias: str, read_only: bool) -> str:
+    try:
+        return json.dumps(attach(path, alias, read_only))
+    except Exception as e:
+        return f"Error attaching database: {str(e)}"
+
+
+@mcp.tool()
+async def execute_sql(
+    sql: str, page_size: int = PAGE_SIZE, output_format: str = "json"
+) -> str:
+    """Executes a SQL query against the DuckDB database.
+
+    Returns the first page of rows (at most page_size, capped at 1000). If
+    has_more is true, pass the returned result_id to fetch_page for the next
+    page. With output_format "parquet" or "arrow" the full result is written to
+    a file instead, and only its path, columns and row count are returned.
+    Results that fit in one page are cached until a write touches their tables.
+    Each call runs on a fresh cursor, so transactions, TEMP tables, USE and
+    SET schema/search_path do not carry over to later calls; a call that ends
+    inside an open transaction or with one of the others is rejected.
+    """
+    if output_format == "json":
+        response = cache.get((normalize_sql(sql), clamp_page_size(page_size)))
+        if response is not None:
+            return response
+    return await run_in_worker(run_sql, sql, page_size, output_format)
+
+
+@mcp.tool()
+async def fetch_page(result_id: str, page_size: int = PAGE_SIZE) -> str:
+    """Fetches the next page of a result returned by execute_sql."""
+    return await run_in_worker(run_fetch_page, result_id, page_size)
+
+
+@mcp.tool()
+async def close_result(result_id: str) -> str:
+    """Releases a paged result that is no longer needed."""
+    result = pop_result(result_id)
+    if result is None:
+        return f"Error closing result: unknown result_id {result_id!r}"
+    await run_in_worker(result.close)
+    return json.dumps({"closed": result_id})
+
+
+@mcp.tool()
+async def get_cache_stats() -> str:
+    """Returns hit/miss, eviction and size statistics of the query result cache."""
+    return json.dumps(cache.snapshot())
+
+
+@mcp.tool()
+async def get_tables() -> str:
+    """Retrieves the tables and views of the DuckDB database and any attached
+    databases, as [database, schema, name, type] rows."""
+    return await run_in_worker(list_tables)
+
+
+def run_schema_catalog() -> str:
+    try:
+        return schema_catalog.build()
+    except Exception as e:
+        return f"Error building schema catalog: {str(e)}"
+
+
+@mcp.tool()
+async def get_schema_catalog() -> str:
+    """Returns every table and view with its type, row count and columns as
+    [name, type, sample values], in one call. Use it instead of DESCRIBE on each
+    table. Cached until the schema changes, so row counts may lag behind writes."""
+    catalog = schema_catalog.get()
+    if catalog is not None:
+        return catalog
+    return await run_in_worker(run_schema_catalog)
+
+
+@mcp.tool()
+async def register_files(name: str, path: str, file_format: str = "auto") -> str:
+    """Registers Parquet or CSV files (a path or glob such as data/*.parquet) as a
+    view named name. The files are queried in place, nothing is copied.
+    file_format is "parquet", "csv" or "auto" (from the file extension)."""
+    return await run_in_worker(run_register_files, name, path, file_format)
+
+
+@mcp.tool()
+async def attach_database(path: str, alias: str, read_only: bool = True) -> str:
+    """Attaches a SQLite or DuckDB database file under alias; query its tables
+    as alias.table_name."""
+    return await run_in_worker(run_attach_database, path, alias, read_only)
+
+
+if DATABASE == ":memory:":
+    # Example: Create a sample table for testing
+    conn.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER, name VARCHAR);")
+    conn.execute("INSERT INTO users VALUES (1, 'Alice'), (2, 'Bob');")
+
+for alias, path in parse_sources(os.environ.get("DUCKDB_MCP_ATTACH", "")):
+    attach(path, alias)
+for name, path in parse_sources(os.environ.get("DUCKDB_MCP_VIEWS", "")):
+    register_view(name, path)
 
 if __name__ == "__main__":
     mcp.run(transport="sse")
@@ -1,12 +1,33 @@
 import concurrent.futures
+import copy
+import hashlib
+import json
+import math
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
 import time
-from concurrent.futures import wait
-from typing import Tuple
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+import dask
+import dask.array as da
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import ray
 import typer
-from dask.distributed import Client
+from dask.distributed import Client, as_completed, wait
+from ray.util import ActorPool
 from sklearn.dummy import DummyClassifier
 from tqdm import tqdm
 
@@ -27,163 +48,1985 @@ def get_data(
     return x_train, y_train, x_test
 
 
+class Tracer:
+    """Collects spans as Chrome trace events and summarizes where time goes.
+
+    Subclass and override ``record`` to send events somewhere else. Spans
+    recorded inside worker processes are returned with task results and
+    merged into the driver's tracer.
+    """
+
+    def __init__(self):
+        self.events: List[dict] = []
+
+    def record(self, event: dict) -> None:
+        self.events.append(event)
+
+    def complete(self, name: str, cat: str, start: float, end: float, **args) -> None:
+        # wall clock, so spans from different processes share a timeline
+        self.record(
+            {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": max(end - start, 0.0) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.complete(name, cat, start, time.time(), **args)
+
+    def export_chrome_trace(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps({"traceEvents": self.events}))
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.events:
+            return {"wall_s": 0.0, "spans": {}, "utilization": {}}
+        begin = min(e["ts"] for e in self.events)
+        end = max(e["ts"] + e["dur"] for e in self.events)
+        wall = (end - begin) / 1e6
+
+        spans: Dict[str, Dict[str, float]] = {}
+        busy: Dict[str, float] = {}
+        for e in self.events:
+            stats = spans.setdefault(
+                e["name"], {"count": 0, "total_s": 0.0, "max_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["total_s"] += e["dur"] / 1e6
+            stats["max_ms"] = max(stats["max_ms"], e["dur"] / 1e3)
+            if e["name"] == "predict":
+                worker = f"{e['pid']}/{e['tid']}"
+                busy[worker] = busy.get(worker, 0.0) + e["dur"] / 1e6
+        for stats in spans.values():
+            stats["mean_ms"] = stats["total_s"] * 1e3 / stats["count"]
+
+        # share of the run each worker thread spent inside predict
+        utilization = {worker: t / wall for worker, t in sorted(busy.items())}
+        return {"wall_s": wall, "spans": spans, "utilization": utilization}
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        print(f"Traced {summary['wall_s']:.3f}s")
+        for name, stats in sorted(
+            summary["spans"].items(), key=lambda item: -item[1]["total_s"]
+        ):
+            print(
+                f"  {name:<16} n={stats['count']:<7} total={stats['total_s']:.3f}s "
+                f"mean={stats['mean_ms']:.3f}ms max={stats['max_ms']:.3f}ms"
+            )
+        for worker, share in summary["utilization"].items():
+            print(f"  worker {worker:<24} utilization={share:.1%}")
+
+
+# Tracers hang off thread objects rather than module globals: Ray and Dask
+# pickle functions from __main__ by value, globals included. The driver's
+# tracer sits on the main thread, traced tasks set one on their own thread.
+TRACER_ATTR = "inference_tracer"
+TRACE_EVENTS_ATTR = "inference_trace_events"
+
+
+def current_tracer() -> Optional[Tracer]:
+    return getattr(threading.current_thread(), TRACER_ATTR, None) or getattr(
+        threading.main_thread(), TRACER_ATTR, None
+    )
+
+
+def start_worker_trace() -> None:
+    # dask.array blocks append their events here until the driver drains them
+    setattr(threading.main_thread(), TRACE_EVENTS_ATTR, [])
+
+
+def drain_worker_trace() -> List[dict]:
+    events = getattr(threading.main_thread(), TRACE_EVENTS_ATTR, [])
+    if hasattr(threading.main_thread(), TRACE_EVENTS_ATTR):
+        delattr(threading.main_thread(), TRACE_EVENTS_ATTR)
+    return events
+
+
+def tracing_enabled() -> bool:
+    return current_tracer() is not None
+
+
+def trace_span(name: str, cat: str, **args):
+    tracer = current_tracer()
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, cat, **args)
+
+
+def record_task_events(
+    events: List[dict], submitted_at: float, received_at: Optional[float] = None
+) -> None:
+    """Merge worker events and derive queue wait and result transfer per task."""
+    tracer = current_tracer()
+    if tracer is None:
+        return
+    for event in events:
+        tracer.record(event)
+        if event["name"] != "task":
+            continue
+        started_at = event["ts"] / 1e6
+        tracer.complete(
+            "queue_wait", "scheduler", submitted_at, started_at, worker=event["pid"]
+        )
+        if received_at is not None:
+            # result serialization plus time until the driver picks it up
+            tracer.complete(
+                "transfer",
+                "transfer",
+                started_at + event["dur"] / 1e6,
+                received_at,
+                worker=event["pid"],
+            )
+
+
+@contextmanager
+def trace_run(trace_path: Optional[str] = None) -> Iterator[Optional[Tracer]]:
+    """Trace everything inside the block, then export and print a summary."""
+    if trace_path is None:
+        yield None
+        return
+    tracer = Tracer()
+    setattr(threading.main_thread(), TRACER_ATTR, tracer)
+    try:
+        yield tracer
+    finally:
+        delattr(threading.main_thread(), TRACER_ATTR)
+        tracer.export_chrome_trace(trace_path)
+        summary_path = Path(trace_path).with_suffix(".summary.json")
+        summary_path.write_text(json.dumps(tracer.summary(), indent=2))
+        tracer.print_summary()
+        print(f"Trace written to {trace_path}, summary to {summary_path}")
+
+
 def predict(model: DummyClassifier, x: np.ndarray) -> np.ndarray:
-    time.sleep(0.002)
-    return model.predict(x)
+    with trace_span("predict", "compute", rows=len(x)):
+        time.sleep(0.002)
+        return model.predict(x)
 
 
-def run_inference(
-    model: DummyClassifier, x_test: np.ndarray, batch_size: int = 2048
+def predict_queued(
+    model: DummyClassifier, x: np.ndarray, submitted_at: float
+) -> Tuple[np.ndarray, float]:
+    # runs on a pool thread, the gap since submit is time spent queued
+    tracer = current_tracer()
+    if tracer is not None:
+        tracer.complete("queue_wait", "scheduler", submitted_at, time.time())
+    s = time.perf_counter()
+    y = predict(model, x)
+    return y, time.perf_counter() - s
+
+
+class AdaptiveBatchSize:
+    """Batch size that re-probes its neighbours when throughput degrades.
+
+    Each batch reports its rows and predict time via ``record``. Once the
+    smoothed throughput stays ``tolerance`` below the best seen for
+    ``patience`` batches, half, current and double sizes are each measured
+    for ``probe_batches`` batches and the fastest one is kept.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 2048,
+        min_batch_size: int = 64,
+        max_batch_size: int = 262_144,
+        tolerance: float = 0.2,
+        patience: int = 10,
+        probe_batches: int = 3,
+        smoothing: float = 0.2,
+    ):
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.tolerance = tolerance
+        self.patience = patience
+        self.probe_batches = probe_batches
+        self.smoothing = smoothing
+
+        self.throughput: Optional[float] = None
+        self.best_throughput = 0.0
+        self.slow_batches = 0
+        self.probes: List[Tuple[int, List[float]]] = []
+
+    def __int__(self) -> int:
+        return self.batch_size
+
+    __index__ = __int__
+
+    def record(self, rows: int, seconds: float) -> None:
+        throughput = rows / max(seconds, 1e-9)
+        if self.probes:
+            self.record_probe(throughput)
+            return
+
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput += self.smoothing * (throughput - self.throughput)
+
+        if self.throughput >= self.best_throughput:
+            self.best_throughput = self.throughput
+            self.slow_batches = 0
+        elif self.throughput < (1 - self.tolerance) * self.best_throughput:
+            self.slow_batches += 1
+            if self.slow_batches >= self.patience:
+                self.start_probe()
+
+    def start_probe(self) -> None:
+        sizes = {
+            max(self.min_batch_size, self.batch_size // 2),
+            self.batch_size,
+            min(self.max_batch_size, self.batch_size * 2),
+        }
+        self.probes = [(size, []) for size in sorted(sizes)]
+        self.batch_size = self.probes[0][0]
+
+    def record_probe(self, throughput: float) -> None:
+        for _, measurements in self.probes:
+            if len(measurements) < self.probe_batches:
+                measurements.append(throughput)
+                break
+
+        pending = [size for size, m in self.probes if len(m) < self.probe_batches]
+        if pending:
+            self.batch_size = pending[0]
+            return
+
+        # all neighbours measured, keep the fastest and reset the baseline
+        throughputs = {size: float(np.mean(m)) for size, m in self.probes}
+        self.batch_size = max(throughputs, key=throughputs.get)
+        self.throughput = self.best_throughput = throughputs[self.batch_size]
+        self.slow_batches = 0
+        self.probes = []
+
+
+BatchSize = Union[int, AdaptiveBatchSize]
+BATCH_SIZE_CANDIDATES = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+TASKS_PER_WORKER = 8
+
+
+def trace_tasks(batch_size: BatchSize) -> bool:
+    # adaptive sizes need the per-batch predict spans back from the workers
+    return tracing_enabled() or isinstance(batch_size, AdaptiveBatchSize)
+
+
+def record_batch_timings(batch_size: BatchSize, events: List[dict]) -> None:
+    """Feed predict spans from a remote task into the driver's batch size.
+
+    Tasks get ``int(batch_size)`` when submitted, so short tail batches and
+    batches of tasks submitted before the size last changed are skipped.
+    """
+    if not isinstance(batch_size, AdaptiveBatchSize):
+        return
+    for event in events:
+        if event["name"] == "predict" and event["args"]["rows"] == int(batch_size):
+            batch_size.record(event["args"]["rows"], event["dur"] / 1e6)
+
+
+class DataSource(ABC):
+    """Lazy, picklable row range over an on-disk array.
+
+    Slicing returns another view, so only the path and (start, stop) are
+    shipped to workers, which then stream the rows they need.
+    """
+
+    def __init__(self, path: str, start: int = 0, stop: Optional[int] = None):
+        self.path = path
+        self.start = start
+        self.stop = self.num_rows() if stop is None else stop
+
+    @abstractmethod
+    def num_rows(self) -> int: ...
+
+    @abstractmethod
+    def iter_pieces(self, start: int, stop: int) -> Iterator[np.ndarray]: ...
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    @property
+    def shape(self) -> Tuple[int]:
+        return (len(self),)
+
+    def __getitem__(self, key: slice) -> "DataSource":
+        start, stop, step = key.indices(len(self))
+        if step != 1:
+            raise ValueError("Data sources only support contiguous slices")
+        view = copy.copy(self)
+        view.start = self.start + start
+        view.stop = self.start + max(start, stop)
+        return view
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        x = np.concatenate(list(self.iter_pieces(self.start, self.stop)))
+        return x if dtype is None else x.astype(dtype)
+
+    def iter_batches(self, batch_size: BatchSize) -> Iterator[np.ndarray]:
+        # re-batch file blocks into fixed-size batches, only one block is resident
+        pending: List[np.ndarray] = []
+        pending_rows = 0
+        for piece in self.iter_pieces(self.start, self.stop):
+            while len(piece) > 0:
+                take = min(int(batch_size) - pending_rows, len(piece))
+                pending.append(piece[:take])
+                pending_rows += take
+                piece = piece[take:]
+                if pending_rows >= int(batch_size):
+                    yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                    pending, pending_rows = [], 0
+        if pending:
+            yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+
+
+def overlapping_blocks(
+    block_rows: List[int], start: int, stop: int
+) -> Iterator[Tuple[int, int, int]]:
+    # (block index, first row, last row) of each block intersecting [start, stop)
+    offset = 0
+    for i, num_rows in enumerate(block_rows):
+        lo, hi = max(start, offset), min(stop, offset + num_rows)
+        if lo < hi:
+            yield i, lo - offset, hi - offset
+        offset += num_rows
+
+
+class NpyDataSource(DataSource):
+    def num_rows(self) -> int:
+        return np.load(self.path, mmap_mode="r").shape[0]
+
+    def iter_pieces(self, start: int, stop: int) -> Iterator[np.ndarray]:
+        # pages are read on access and can be evicted by the OS
+        yield np.load(self.path, mmap_mode="r")[start:stop]
+
+
+class ParquetDataSource(DataSource):
+    def __init__(
+        self, path: str, column: str = "x", start: int = 0, stop: Optional[int] = None
+    ):
+        self.column = column
+        super().__init__(path, start=start, stop=stop)
+
+    def num_rows(self) -> int:
+        return pq.ParquetFile(self.path).metadata.num_rows
+
+    def iter_pieces(self, start: int, stop: int) -> Iterator[np.ndarray]:
+        parquet_file = pq.ParquetFile(self.path)
+        block_rows = [
+            parquet_file.metadata.row_group(i).num_rows
+            for i in range(parquet_file.num_row_groups)
+        ]
+        for i, lo, hi in overlapping_blocks(block_rows, start, stop):
+            row_group = parquet_file.read_row_group(i, columns=[self.column])
+            yield row_group.column(0).slice(lo, hi - lo).to_numpy()
+
+
+class ArrowDataSource(DataSource):
+    def __init__(
+        self, path: str, column: str = "x", start: int = 0, stop: Optional[int] = None
+    ):
+        self.column = column
+        super().__init__(path, start=start, stop=stop)
+
+    def num_rows(self) -> int:
+        with pa.memory_map(self.path) as source:
+            reader = pa.ipc.open_file(source)
+            return sum(
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            )
+
+    def iter_pieces(self, start: int, stop: int) -> Iterator[np.ndarray]:
+        # memory-mapped record batches, numeric columns convert without a copy
+        with pa.memory_map(self.path) as source:
+            reader = pa.ipc.open_file(source)
+            block_rows = [
+                reader.get_batch(i).num_rows for i in range(reader.num_record_batches)
+            ]
+            for i, lo, hi in overlapping_blocks(block_rows, start, stop):
+                batch = reader.get_batch(i)
+                yield batch.column(self.column).slice(lo, hi - lo).to_numpy()
+
+
+DATA_SOURCES = {
+    ".npy": NpyDataSource,
+    ".parquet": ParquetDataSource,
+    ".arrow": ArrowDataSource,
+    ".feather": ArrowDataSource,
+}
+
+InferenceInput = Union[np.ndarray, DataSource]
+
+
+def open_data_source(path: str) -> DataSource:
+    suffix = Path(path).suffix
+    if suffix not in DATA_SOURCES:
+        raise ValueError(
+            f"Unsupported data file {path}, use one of {list(DATA_SOURCES)}"
+        )
+    return DATA_SOURCES[suffix](path)
+
+
+def iter_batches(x_test: InferenceInput, batch_size: BatchSize) -> Iterator[np.ndarray]:
+    if isinstance(x_test, DataSource):
+        yield from x_test.iter_batches(batch_size)
+        return
+    offset = 0
+    while offset < x_test.shape[0]:
+        # an adaptive batch size may change between batches
+        size = int(batch_size)
+        yield x_test[offset : offset + size]
+        offset += size
+
+
+def probe_batch_sizes(
+    run_fn: Callable[..., np.ndarray],
+    model: DummyClassifier,
+    x_sample: np.ndarray,
+    candidates: Sequence[int] = BATCH_SIZE_CANDIDATES,
+) -> List[dict]:
+    probes = []
+    for batch_size in candidates:
+        # latency of a single predict call at this size
+        s = time.perf_counter()
+        predict(model, x_sample[:batch_size])
+        batch_latency = time.perf_counter() - s
+
+        # end-to-end throughput of the backend at this size
+        s = time.perf_counter()
+        run_fn(x_sample, batch_size)
+        elapsed = time.perf_counter() - s
+        probes.append(
+            {
+                "batch_size": batch_size,
+                "throughput": len(x_sample) / elapsed,
+                "batch_latency": batch_latency,
+            }
+        )
+    return probes
+
+
+def autotune_batch_size(
+    backend: str,
+    run_fn: Callable[..., np.ndarray],
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    candidates: Sequence[int] = BATCH_SIZE_CANDIDATES,
+    sample_size: int = 500_000,
+    max_batch_latency: Optional[float] = None,
+    cache_path: Optional[str] = "cache/batch_size.json",
+) -> int:
+    # tuned sizes are reused per backend, model and machine type
+    key = f"{backend}/{type(model).__name__}/{platform.machine()}-{os.cpu_count()}cpu"
+    cache = {}
+    if cache_path is not None and Path(cache_path).exists():
+        cache = json.loads(Path(cache_path).read_text())
+        if key in cache:
+            return cache[key]["batch_size"]
+
+    x_sample = np.asarray(x_test[:sample_size])
+    probes = probe_batch_sizes(run_fn, model, x_sample, candidates=candidates)
+    allowed = [
+        probe
+        for probe in probes
+        if max_batch_latency is None or probe["batch_latency"] <= max_batch_latency
+    ]
+    best = max(allowed or probes[:1], key=lambda probe: probe["throughput"])
+
+    for probe in probes:
+        print(
+            f"Batch size {probe['batch_size']}: {probe['throughput']:.0f} rows/s, "
+            f"{probe['batch_latency'] * 1000:.1f} ms/batch"
+        )
+    print(f"Selected batch size {best['batch_size']} for {key}")
+
+    if cache_path is not None:
+        cache[key] = {"batch_size": best["batch_size"], "probes": probes}
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(cache_path).write_text(json.dumps(cache, indent=2))
+    return best["batch_size"]
+
+
+def resolve_batch_size(
+    batch_size: int,
+    autotune: bool,
+    backend: str,
+    run_fn: Callable[..., np.ndarray],
+    model: DummyClassifier,
+    x_test: InferenceInput,
+) -> BatchSize:
+    if not autotune:
+        return batch_size
+    # start from the probed size and keep adjusting during the run
+    tuned = autotune_batch_size(backend, run_fn, model, x_test)
+    return AdaptiveBatchSize(batch_size=tuned)
+
+
+def allocate_output(
+    model: DummyClassifier, x_test: InferenceInput, output_path: Optional[str] = None
+) -> np.ndarray:
+    # probe dtype and trailing shape of predictions on a single row
+    y_probe = model.predict(np.asarray(x_test[:1]))
+    shape = (len(x_test), *y_probe.shape[1:])
+    if output_path is None:
+        return np.empty(shape, dtype=y_probe.dtype)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    return np.lib.format.open_memmap(
+        output_path, mode="w+", dtype=y_probe.dtype, shape=shape
+    )
+
+
+def default_output_path(
+    x_test: InferenceInput, output_path: Optional[str] = None
+) -> Optional[str]:
+    # predictions of a streamed input may not fit in RAM either
+    if output_path is None and isinstance(x_test, DataSource):
+        output_path = str(Path(x_test.path).with_suffix(".predictions.npy"))
+        print(f"Writing predictions to {output_path}")
+    return output_path
+
+
+def output_file(out: np.ndarray) -> Optional[str]:
+    # workers on this host can open a .npy output and write their slice in place
+    if isinstance(out, np.memmap) and str(out.filename).endswith(".npy"):
+        return str(out.filename)
+    return None
+
+
+def predict_into(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    out: np.ndarray,
+    batch_size: BatchSize = 2048,
+    progress: bool = False,
 ) -> np.ndarray:
-    y_pred = []
+    batches = iter_batches(x_test, batch_size)
+    if progress:
+        batches = tqdm(batches, total=math.ceil(len(x_test) / int(batch_size)))
 
-    for i in tqdm(range(0, x_test.shape[0], batch_size)):
-        x_batch = x_test[i : i + batch_size]
+    offset = 0
+    for x_batch in batches:
+        s = time.perf_counter()
         y_batch = predict(model, x_batch)
-        y_pred.append(y_batch)
-    return np.concatenate(y_pred)
+        if isinstance(batch_size, AdaptiveBatchSize):
+            batch_size.record(len(x_batch), time.perf_counter() - s)
+        out[offset : offset + len(y_batch)] = y_batch
+        offset += len(y_batch)
+    return out
+
+
+def run_inference(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    batch_size: BatchSize = 2048,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    if out is None:
+        out = allocate_output(model, x_test)
+    return predict_into(model, x_test, out, batch_size=batch_size, progress=True)
+
+
+def run_inference_concurrent(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    batch_size: BatchSize = 2048,
+    max_in_flight: int = 16,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    if out is None:
+        out = allocate_output(model, x_test)
+
+    # overlap I/O-bound predict calls, keeping at most max_in_flight outstanding
+    in_flight: deque = deque()
+
+    def collect() -> None:
+        # oldest first, so output order is preserved
+        batch_offset, future = in_flight.popleft()
+        y_batch, seconds = future.result()
+        if isinstance(batch_size, AdaptiveBatchSize):
+            batch_size.record(len(y_batch), seconds)
+        out[batch_offset : batch_offset + len(y_batch)] = y_batch
+
+    offset = 0
+    num_batches = math.ceil(len(x_test) / int(batch_size))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for x_batch in tqdm(iter_batches(x_test, batch_size), total=num_batches):
+            if len(in_flight) == max_in_flight:
+                collect()
+            in_flight.append(
+                (
+                    offset,
+                    executor.submit(predict_queued, model, x_batch, time.time()),
+                )
+            )
+            offset += len(x_batch)
+
+        while in_flight:
+            collect()
+    return out
+
+
+def run_inference_chunk(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    offset: int,
+    output_path: Optional[str] = None,
+    batch_size: BatchSize = 2048,
+) -> Optional[np.ndarray]:
+    # progress is reported by the scheduler across all workers
+    if output_path is None:
+        out = allocate_output(model, x_test)
+        return predict_into(model, x_test, out, batch_size=batch_size)
+
+    out = np.load(output_path, mmap_mode="r+")
+    predict_into(
+        model, x_test, out[offset : offset + len(x_test)], batch_size=batch_size
+    )
+    out.flush()
+    return None
+
+
+def run_scheduled_task(
+    fn: Callable[..., Optional[np.ndarray]], trace: bool = False, **kwargs
+) -> Tuple[int, Optional[np.ndarray], List[dict]]:
+    # tag results with the worker process so progress can be split per worker
+    if not trace:
+        return os.getpid(), fn(**kwargs), []
+
+    # trace into a task-local tracer and ship its events back with the result
+    thread = threading.current_thread()
+    tracer = Tracer()
+    setattr(thread, TRACER_ATTR, tracer)
+    try:
+        with tracer.span("task", "worker"):
+            y = fn(**kwargs)
+    finally:
+        delattr(thread, TRACER_ATTR)
+    return os.getpid(), y, tracer.events
+
+
+def split_tasks(
+    num_rows: int, max_workers: int, task_size: Optional[int] = None
+) -> List[Tuple[int, int]]:
+    if task_size == 0:
+        # one balanced range per worker, no trailing remainder chunk
+        bounds = [i * num_rows // max_workers for i in range(max_workers + 1)]
+        return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if lo < hi]
+    if task_size is None:
+        # many small tasks, so faster workers pick up more of the work
+        task_size = max(1, math.ceil(num_rows / (TASKS_PER_WORKER * max_workers)))
+    return [
+        (start, min(start + task_size, num_rows))
+        for start in range(0, num_rows, task_size)
+    ]
+
+
+def wait_first_completed(futures: list) -> Tuple[list, list]:
+    done, pending = concurrent.futures.wait(
+        futures, return_when=concurrent.futures.FIRST_COMPLETED
+    )
+    return list(done), list(pending)
+
+
+class Checkpoint:
+    """Chunk manifest plus one ``.npy`` file per finished chunk in ``path``.
+
+    The manifest fixes the task split and the input/model ``fingerprint`` on
+    the first run; a chunk counts as done once its file exists, so a restarted
+    run over the same input and model only recomputes missing chunks.
+    """
+
+    def __init__(self, path: str, fingerprint: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.manifest_path = self.path / "manifest.json"
+        self.fingerprint = fingerprint
+
+    def chunk_path(self, start: int, stop: int) -> Path:
+        return self.path / f"chunk-{start:012d}-{stop:012d}.npy"
+
+    def resume(
+        self, tasks: List[Tuple[int, int]], out: np.ndarray
+    ) -> List[Tuple[int, int]]:
+        """Load finished chunks into ``out`` and return the tasks left to run."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self.manifest_path.exists():
+            manifest = json.loads(self.manifest_path.read_text())
+            if manifest["num_rows"] != len(out):
+                raise ValueError(
+                    f"Checkpoint {self.path} has {manifest['num_rows']} rows, "
+                    f"input has {len(out)}"
+                )
+            if manifest.get("fingerprint") != self.fingerprint:
+                raise ValueError(
+                    f"Checkpoint {self.path} was written for a different input "
+                    f"or model: {manifest.get('fingerprint')} != {self.fingerprint}"
+                )
+            # keep the original split so finished chunk files still line up
+            tasks = [(start, stop) for start, stop in manifest["tasks"]]
+        else:
+            self.manifest_path.write_text(
+                json.dumps(
+                    {
+                        "num_rows": len(out),
+                        "tasks": tasks,
+                        "fingerprint": self.fingerprint,
+                    },
+                    indent=2,
+                )
+            )
+
+        pending = []
+        for start, stop in tasks:
+            chunk_path = self.chunk_path(start, stop)
+            if chunk_path.exists():
+                out[start:stop] = np.load(chunk_path)
+            else:
+                pending.append((start, stop))
+        if len(pending) < len(tasks):
+            print(
+                f"Resuming from {self.path}: "
+                f"{len(tasks) - len(pending)}/{len(tasks)} chunks done"
+            )
+        return pending
+
+    def save(self, start: int, stop: int, y: np.ndarray) -> None:
+        # write then rename, so a chunk file only exists once it is complete
+        chunk_path = self.chunk_path(start, stop)
+        tmp_path = chunk_path.with_name(chunk_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, y)
+        os.replace(tmp_path, chunk_path)
+
+
+def open_checkpoint(
+    checkpoint_dir: Optional[str], model: DummyClassifier, x_test: InferenceInput
+) -> Optional[Checkpoint]:
+    if checkpoint_dir is None:
+        return None
+    if not isinstance(x_test, DataSource):
+        raise ValueError(
+            "--checkpoint-dir needs --data-path, generated input differs on every run"
+        )
+    stat = os.stat(x_test.path)
+    fingerprint = {
+        "data_path": os.path.abspath(x_test.path),
+        "data_size": stat.st_size,
+        "data_mtime_ns": stat.st_mtime_ns,
+        "start": x_test.start,
+        "stop": x_test.stop,
+        "model_sha256": hashlib.sha256(pickle.dumps(model)).hexdigest(),
+    }
+    return Checkpoint(checkpoint_dir, fingerprint)
+
+
+def run_scheduled(
+    tasks: List[Tuple[int, int]],
+    submit: Callable[[int, int], Any],
+    out: np.ndarray,
+    max_in_flight: int,
+    wait_first: Callable[[list], Tuple[list, list]] = wait_first_completed,
+    get_result: Callable[
+        [Any], Tuple[int, Optional[np.ndarray], List[dict]]
+    ] = lambda f: f.result(),
+    checkpoint: Optional[Checkpoint] = None,
+    batch_size: Optional[BatchSize] = None,
+) -> Dict[int, int]:
+    """Hand out (start, stop) tasks from a shared queue to whichever worker is free.
+
+    At most ``max_in_flight`` tasks are outstanding, so fast workers pick up
+    more of the queue and slow ones never hold a large fixed chunk. Returns
+    the number of rows processed by each worker. With a ``checkpoint``,
+    finished tasks are skipped and every completed task is saved. An adaptive
+    ``batch_size`` is fed the predict timings of every finished task.
+    """
+    if checkpoint is not None:
+        tasks = checkpoint.resume(tasks, out)
+    queue = deque(tasks)
+    in_flight: Dict[Any, Tuple[int, int, float]] = {}
+    rows_per_worker: Dict[int, int] = {}
+
+    with tqdm(total=sum(hi - lo for lo, hi in tasks), unit="rows") as progress:
+        while queue or in_flight:
+            while queue and len(in_flight) < max_in_flight:
+                start, stop = queue.popleft()
+                with trace_span("submit", "scheduler", rows=stop - start):
+                    future = submit(start, stop)
+                in_flight[future] = (start, stop, time.time())
+
+            done, _ = wait_first(list(in_flight))
+            received_at = time.time()
+            for future in done:
+                start, stop, submitted_at = in_flight.pop(future)
+                with trace_span("fetch", "transfer", rows=stop - start):
+                    worker, y_task, events = get_result(future)
+                record_task_events(events, submitted_at, received_at)
+                record_batch_timings(batch_size, events)
+                with trace_span("copy", "driver", rows=stop - start):
+                    if y_task is not None:
+                        out[start : start + len(y_task)] = y_task
+                if checkpoint is not None:
+                    with trace_span("checkpoint", "driver", rows=stop - start):
+                        checkpoint.save(start, stop, out[start:stop])
+                rows_per_worker[worker] = rows_per_worker.get(worker, 0) + stop - start
+                progress.update(stop - start)
+                progress.set_postfix(
+                    workers=len(rows_per_worker),
+                    min_rows=min(rows_per_worker.values()),
+                    max_rows=max(rows_per_worker.values()),
+                )
+    return rows_per_worker
 
 
 def run_inference_process_pool(
-    model: DummyClassifier, x_test: np.ndarray, max_workers: int = 16
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    max_workers: int = 16,
+    batch_size: BatchSize = 2048,
+    task_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    checkpoint: Optional[Checkpoint] = None,
 ) -> np.ndarray:
+    if out is None:
+        out = allocate_output(model, x_test)
+
     # with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
     with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        chunk_size = len(x_test) // max_workers
+        run_scheduled(
+            split_tasks(len(x_test), max_workers, task_size),
+            lambda start, stop: executor.submit(
+                run_scheduled_task,
+                run_inference_chunk,
+                trace=trace_tasks(batch_size),
+                model=model,
+                x_test=x_test[start:stop],
+                offset=start,
+                output_path=output_file(out),
+                batch_size=int(batch_size),
+            ),
+            out=out,
+            max_in_flight=2 * max_workers,
+            checkpoint=checkpoint,
+            batch_size=batch_size,
+        )
+    return out
 
-        chunks = []
-        # split in to chunks
-        for i in range(0, len(x_test), chunk_size):
-            chunks.append(x_test[i : i + chunk_size])
 
-        futures = []
-        # submit chunks for inference
-        for chunk in chunks:
-            future = executor.submit(run_inference, model=model, x_test=chunk)
-            futures.append(future)
+def run_inference_shared_chunk(
+    model: DummyClassifier,
+    shm_name: str,
+    shape: Tuple[int, ...],
+    dtype: str,
+    offset: int,
+    length: int,
+    output_path: Optional[str] = None,
+    batch_size: BatchSize = 2048,
+) -> Optional[np.ndarray]:
+    # attach to the driver's buffer, only the (offset, length) descriptor was sent
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        x_test = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        y_pred = run_inference_chunk(
+            model=model,
+            x_test=x_test[offset : offset + length],
+            offset=offset,
+            output_path=output_path,
+            batch_size=batch_size,
+        )
+        del x_test
+    finally:
+        shm.close()
+    return y_pred
 
-        # wait for all futures
-        wait(futures)
 
-        y_pred = []
-        for future in futures:
-            y_batch = future.result()
-            y_pred.append(y_batch)
-    return np.concatenate(y_pred)
+@contextmanager
+def shared_array(x_test: np.ndarray) -> Iterator[shared_memory.SharedMemory]:
+    if not isinstance(x_test, np.ndarray):
+        raise ValueError("Shared memory mode needs an in-memory numpy array")
+    shm = shared_memory.SharedMemory(create=True, size=x_test.nbytes)
+    try:
+        # copy input once into shared memory
+        x_shared = np.ndarray(x_test.shape, dtype=x_test.dtype, buffer=shm.buf)
+        x_shared[:] = x_test
+        del x_shared
+        yield shm
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def submit_shared_task(
+    executor: concurrent.futures.Executor,
+    fn: Callable[..., Optional[np.ndarray]],
+    shm: shared_memory.SharedMemory,
+    x_test: np.ndarray,
+    start: int,
+    stop: int,
+    batch_size: BatchSize,
+    **kwargs,
+) -> concurrent.futures.Future:
+    # submit an (offset, length) descriptor instead of data
+    return executor.submit(
+        run_scheduled_task,
+        fn,
+        trace=trace_tasks(batch_size),
+        shm_name=shm.name,
+        shape=x_test.shape,
+        dtype=x_test.dtype.str,
+        offset=start,
+        length=stop - start,
+        batch_size=int(batch_size),
+        **kwargs,
+    )
+
+
+def run_inference_process_pool_shared_memory(
+    model: DummyClassifier,
+    x_test: np.ndarray,
+    max_workers: int = 16,
+    batch_size: BatchSize = 2048,
+    task_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    checkpoint: Optional[Checkpoint] = None,
+) -> np.ndarray:
+    if out is None:
+        out = allocate_output(model, x_test)
+
+    with shared_array(x_test) as shm:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers
+        ) as executor:
+            run_scheduled(
+                split_tasks(len(x_test), max_workers, task_size),
+                lambda start, stop: submit_shared_task(
+                    executor,
+                    run_inference_shared_chunk,
+                    shm=shm,
+                    x_test=x_test,
+                    start=start,
+                    stop=stop,
+                    model=model,
+                    output_path=output_file(out),
+                    batch_size=batch_size,
+                ),
+                out=out,
+                max_in_flight=2 * max_workers,
+                checkpoint=checkpoint,
+                batch_size=batch_size,
+            )
+    return out
+
+
+# model deserialized once per worker process by the pool initializer
+_worker_model: Optional[DummyClassifier] = None
+
+
+def init_inference_worker(model_bytes: bytes) -> None:
+    global _worker_model
+    _worker_model = pickle.loads(model_bytes)
+
+
+def inference_worker_ready() -> int:
+    return os.getpid()
+
+
+def run_inference_worker(**kwargs) -> Optional[np.ndarray]:
+    return run_inference_chunk(model=_worker_model, **kwargs)
+
+
+def run_inference_shared_worker(**kwargs) -> Optional[np.ndarray]:
+    return run_inference_shared_chunk(model=_worker_model, **kwargs)
+
+
+class InferencePool:
+    """Long-lived process pool with the model loaded once per worker."""
+
+    def __init__(self, model: DummyClassifier, max_workers: int = 16):
+        self.model = model
+        self.max_workers = max_workers
+        # workers must share the driver's tracker, or they report attached
+        # shared memory as leaked on exit
+        resource_tracker.ensure_running()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_inference_worker,
+            initargs=(pickle.dumps(model),),
+        )
+        self.warmup()
+
+    def warmup(self) -> List[int]:
+        # start every worker and run the initializer before the first real call
+        futures = [
+            self.executor.submit(inference_worker_ready)
+            for _ in range(self.max_workers)
+        ]
+        return [future.result() for future in futures]
+
+    def run_inference(
+        self,
+        x_test: InferenceInput,
+        use_shared_memory: bool = False,
+        batch_size: BatchSize = 2048,
+        task_size: Optional[int] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        if out is None:
+            out = allocate_output(self.model, x_test)
+
+        tasks = split_tasks(len(x_test), self.max_workers, task_size)
+        if use_shared_memory:
+            with shared_array(x_test) as shm:
+                run_scheduled(
+                    tasks,
+                    lambda start, stop: submit_shared_task(
+                        self.executor,
+                        run_inference_shared_worker,
+                        shm=shm,
+                        x_test=x_test,
+                        start=start,
+                        stop=stop,
+                        output_path=output_file(out),
+                        batch_size=batch_size,
+                    ),
+                    out=out,
+                    max_in_flight=2 * self.max_workers,
+                    batch_size=batch_size,
+                )
+            return out
+
+        run_scheduled(
+            tasks,
+            lambda start, stop: self.executor.submit(
+                run_scheduled_task,
+                run_inference_worker,
+                trace=trace_tasks(batch_size),
+                x_test=x_test[start:stop],
+                offset=start,
+                output_path=output_file(out),
+                batch_size=int(batch_size),
+            ),
+            out=out,
+            max_in_flight=2 * self.max_workers,
+            batch_size=batch_size,
+        )
+        return out
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self) -> "InferencePool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
 
 @ray.remote
 def run_inference_ray(
-    model: DummyClassifier, x_test: np.ndarray, batch_size: int = 2048
-) -> np.ndarray:
-    y_pred = []
-    for i in range(0, x_test.shape[0], batch_size):
-        x_batch = x_test[i : i + batch_size]
-        y_batch = predict(model, x_batch)
-        y_pred.append(y_batch)
-    return np.concatenate(y_pred)
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    batch_size: BatchSize = 2048,
+    trace: bool = False,
+) -> Tuple[int, np.ndarray, List[dict]]:
+    return run_scheduled_task(
+        run_inference_chunk,
+        trace=trace,
+        model=model,
+        x_test=x_test,
+        offset=0,
+        batch_size=batch_size,
+    )
 
 
 def run_inference_ray_main(
-    model: DummyClassifier, x_test: np.ndarray, max_workers: int = 16
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    max_workers: int = 16,
+    batch_size: BatchSize = 2048,
+    task_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    checkpoint: Optional[Checkpoint] = None,
 ) -> np.ndarray:
-    chunk_size = len(x_test) // max_workers
+    if out is None:
+        out = allocate_output(model, x_test)
 
-    chunks = []
-    # Split into chunks
-    for i in range(0, len(x_test), chunk_size):
-        chunks.append(x_test[i : i + chunk_size])
+    # Run inference on tasks, copying results into place as they finish
+    run_scheduled(
+        split_tasks(len(x_test), max_workers, task_size),
+        lambda start, stop: run_inference_ray.remote(
+            model, x_test[start:stop], int(batch_size), trace_tasks(batch_size)
+        ),
+        out=out,
+        max_in_flight=2 * max_workers,
+        wait_first=lambda futures: ray.wait(futures, num_returns=1),
+        get_result=ray.get,
+        checkpoint=checkpoint,
+        batch_size=batch_size,
+    )
+    return out
 
-    # Run inference on chunks
-    futures = [run_inference_ray.remote(model, chunk) for chunk in chunks]
 
-    # Collect results
-    y_pred = ray.get(futures)
-    return np.concatenate(y_pred)
+@ray.remote
+class InferenceActor:
+    """Ray actor holding the model, fed row slices of an object-store input."""
 
+    def __init__(self, model: DummyClassifier):
+        # model is passed as an object ref and resolved once per actor
+        self.model = model
 
-def run_inference_dask(
-    model: DummyClassifier, x_test: np.ndarray, batch_size: int = 2048
+    def run_inference(
+        self,
+        x_test: InferenceInput,
+        start: int,
+        stop: int,
+        batch_size: BatchSize,
+        trace: bool = False,
+    ) -> Tuple[int, np.ndarray, List[dict]]:
+        # on the same node x_test is a read-only view of the object store, no copy
+        _, y_slice, events = run_scheduled_task(
+            run_inference_chunk,
+            trace=trace,
+            model=self.model,
+            x_test=x_test[start:stop],
+            offset=start,
+            batch_size=batch_size,
+        )
+        return start, y_slice, events
+
+
+def run_inference_ray_actors(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    max_workers: int = 16,
+    slice_size: int = 100_000,
+    batch_size: BatchSize = 2048,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    y_pred = []
-    for i in range(0, x_test.shape[0], batch_size):
-        x_batch = x_test[i : i + batch_size]
-        y_batch = predict(model, x_batch)
-        y_pred.append(y_batch)
-    return np.concatenate(y_pred)
+    if out is None:
+        out = allocate_output(model, x_test)
+
+    # ship model and input to the object store once
+    with trace_span("put", "transfer"):
+        model_ref = ray.put(model)
+        x_ref = ray.put(x_test)
+
+    actors = [InferenceActor.remote(model_ref) for _ in range(max_workers)]
+    pool = ActorPool(actors)
+    slices = [
+        (start, min(start + slice_size, len(x_test)))
+        for start in range(0, len(x_test), slice_size)
+    ]
+
+    submitted_at: Dict[int, float] = {}
+
+    def submit(actor, bounds: Tuple[int, int]):
+        submitted_at[bounds[0]] = time.time()
+        return actor.run_inference.remote(
+            x_ref, *bounds, int(batch_size), trace_tasks(batch_size)
+        )
+
+    # idle actors pull the next slice
+    for start, y_slice, events in pool.map_unordered(submit, slices):
+        record_task_events(events, submitted_at.pop(start), time.time())
+        record_batch_timings(batch_size, events)
+        with trace_span("copy", "driver", rows=len(y_slice)):
+            out[start : start + len(y_slice)] = y_slice
+
+    for actor in actors:
+        ray.kill(actor)
+    return out
+
+
+def run_inference_dask(
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    batch_size: BatchSize = 2048,
+    trace: bool = False,
+) -> Tuple[int, np.ndarray, List[dict]]:
+    return run_scheduled_task(
+        run_inference_chunk,
+        trace=trace,
+        model=model,
+        x_test=x_test,
+        offset=0,
+        batch_size=batch_size,
+    )
 
 
 def run_inference_dask_main(
-    client, model: DummyClassifier, x_test: np.ndarray, max_workers: int = 16
+    client,
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    max_workers: int = 16,
+    batch_size: BatchSize = 2048,
+    task_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    chunk_size = len(x_test) // max_workers
+    if out is None:
+        out = allocate_output(model, x_test)
 
-    chunks = []
-    # Split into chunks
-    for i in range(0, len(x_test), chunk_size):
-        chunks.append(x_test[i : i + chunk_size])
+    # Run inference on tasks, copying results into place as they finish
+    run_scheduled(
+        split_tasks(len(x_test), max_workers, task_size),
+        lambda start, stop: client.submit(
+            run_inference_dask,
+            model,
+            x_test[start:stop],
+            int(batch_size),
+            trace_tasks(batch_size),
+            pure=False,
+        ),
+        out=out,
+        max_in_flight=2 * max_workers,
+        wait_first=lambda futures: wait(futures, return_when="FIRST_COMPLETED"),
+        batch_size=batch_size,
+    )
+    return out
 
-    # Run inference on chunks
-    futures = [client.submit(run_inference_dask, model, chunk) for chunk in chunks]
 
-    # Collect results
-    y_pred = client.gather(futures)
-    return np.concatenate(y_pred)
+def predict_block(
+    block: np.ndarray, model: DummyClassifier, batch_size: BatchSize = 2048
+) -> np.ndarray:
+    # traced when the driver has started a trace on this worker
+    events = getattr(threading.main_thread(), TRACE_EVENTS_ATTR, None)
+    _, y_block, task_events = run_scheduled_task(
+        run_inference_chunk,
+        trace=events is not None,
+        model=model,
+        x_test=block,
+        offset=0,
+        batch_size=batch_size,
+    )
+    if events is not None:
+        events.extend(task_events)
+    return y_block
 
 
-def run_single_worker(inference_size: int = 100_000_000):
-    x_train, y_train, x_test = get_data(inference_size=inference_size)
+def to_dask_array(x_test: InferenceInput, chunk_size: int) -> da.Array:
+    if not isinstance(x_test, DataSource):
+        return da.from_array(x_test, chunks=chunk_size)
+
+    # each block is read from disk on the worker that computes it
+    dtype = np.asarray(x_test[:1]).dtype
+    blocks = [
+        da.from_delayed(
+            dask.delayed(np.asarray)(x_test[i : i + chunk_size]),
+            shape=(min(chunk_size, len(x_test) - i),),
+            dtype=dtype,
+        )
+        for i in range(0, len(x_test), chunk_size)
+    ]
+    return da.concatenate(blocks)
+
+
+def run_inference_dask_array(
+    client,
+    model: DummyClassifier,
+    x_test: InferenceInput,
+    chunk_size: int = 1_000_000,
+    batch_size: BatchSize = 2048,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    if out is None:
+        out = allocate_output(model, x_test)
+
+    # send the model to every worker once instead of with each task
+    with trace_span("scatter", "transfer"):
+        # hash=False gives each call its own key, so releasing it cannot
+        # cancel the model of a later run on the same client
+        model_future = client.scatter(model, broadcast=True, hash=False)
+    x = to_dask_array(x_test, chunk_size)
+    # the whole graph is built up front, so an adaptive size stays at its tuned value
+    y = x.map_blocks(predict_block, model_future, int(batch_size), dtype=out.dtype)
+
+    trace = tracing_enabled()
+    if trace:
+        client.run(start_worker_trace)
+
+    # compute blocks on the cluster and copy each into place as it finishes
+    offsets = np.cumsum((0, *y.chunks[0]))[:-1]
+    submitted_at = time.time()
+    futures = dict(zip(client.compute(list(y.to_delayed().ravel())), offsets))
+    for future in as_completed(futures):
+        offset = futures.pop(future)
+        with trace_span("fetch", "transfer"):
+            y_block = future.result()
+        with trace_span("copy", "driver", rows=len(y_block)):
+            out[offset : offset + len(y_block)] = y_block
+        future.release()
+
+    if trace:
+        for events in client.run(drain_worker_trace).values():
+            record_task_events(events, submitted_at)
+    return out
+
+
+def load_data(
+    inference_size: int = 100_000_000, data_path: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray, InferenceInput]:
+    if data_path is None:
+        return get_data(inference_size=inference_size)
+    # stream x_test from disk instead of allocating it, and train on a fixed
+    # draw so reruns over the same file get the same model
+    rng = np.random.default_rng(0)
+    return rng.random(100), rng.random(100), open_data_source(data_path)
+
+
+def write_data(
+    path: str, inference_size: int = 100_000_000, chunk_size: int = 1_000_000
+):
+    suffix = Path(path).suffix
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    chunks = (
+        np.random.rand(min(chunk_size, inference_size - i))
+        for i in range(0, inference_size, chunk_size)
+    )
+    schema = pa.schema([("x", pa.float64())])
+
+    if suffix == ".npy":
+        x = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.float64, shape=(inference_size,)
+        )
+        for i, chunk in zip(range(0, inference_size, chunk_size), chunks):
+            x[i : i + len(chunk)] = chunk
+        x.flush()
+    elif suffix == ".parquet":
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.table({"x": chunk}, schema=schema))
+    elif DATA_SOURCES.get(suffix) is ArrowDataSource:
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in chunks:
+                writer.write_batch(pa.record_batch({"x": chunk}, schema=schema))
+    else:
+        raise ValueError(
+            f"Unsupported data file {path}, use one of {list(DATA_SOURCES)}"
+        )
+    print(f"Wrote {inference_size} rows to {path}")
+
+
+def run_single_worker(
+    inference_size: int = 100_000_000,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
 
     model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend="single",
+        run_fn=lambda x, bs: run_inference(model=model, x_test=x, batch_size=bs),
+        model=model,
+        x_test=x_test,
+    )
 
-    s = time.monotonic()
+    with trace_run(trace_path):
+        s = time.monotonic()
+
+        y_test_predicted = run_inference(
+            model=model, x_test=x_test, batch_size=batch_size, out=out
+        )
 
-    y_test_predicted = run_inference(model=model, x_test=x_test)
+        print(
+            f"Inference one worker {time.monotonic() - s} result: {y_test_predicted.shape}"
+        )
 
-    print(
-        f"Inference one worker {time.monotonic() - s} result: {y_test_predicted.shape}"
+
+def run_concurrent(
+    inference_size: int = 100_000_000,
+    max_in_flight: int = 16,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
+    model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend=f"concurrent-{max_in_flight}",
+        run_fn=lambda x, bs: run_inference_concurrent(
+            model=model, x_test=x, batch_size=bs, max_in_flight=max_in_flight
+        ),
+        model=model,
+        x_test=x_test,
     )
 
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = run_inference_concurrent(
+            model=model,
+            x_test=x_test,
+            batch_size=batch_size,
+            max_in_flight=max_in_flight,
+            out=out,
+        )
+        print(
+            f"Inference {max_in_flight} in-flight batches {time.monotonic() - s} result: {res.shape}"
+        )
 
-def run_pool(inference_size: int = 100_000_000, max_workers: int = 16):
-    x_train, y_train, x_test = get_data(inference_size=inference_size)
+
+def run_pool(
+    inference_size: int = 100_000_000,
+    max_workers: int = 16,
+    use_shared_memory: bool = False,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    task_size: Optional[int] = None,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    checkpoint_dir: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
     model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    checkpoint = open_checkpoint(checkpoint_dir, model, x_test)
+    pool_fn = (
+        run_inference_process_pool_shared_memory
+        if use_shared_memory
+        else run_inference_process_pool
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend=f"pool-{max_workers}",
+        run_fn=lambda x, bs: pool_fn(
+            model=model,
+            x_test=x,
+            max_workers=max_workers,
+            batch_size=bs,
+            task_size=task_size,
+        ),
+        model=model,
+        x_test=x_test,
+    )
+
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = pool_fn(
+            model=model,
+            x_test=x_test,
+            max_workers=max_workers,
+            batch_size=batch_size,
+            task_size=task_size,
+            out=out,
+            checkpoint=checkpoint,
+        )
+        print(
+            f"Inference {max_workers} workers {time.monotonic() - s} result: {res.shape}"
+        )
+
+
+def run_persistent_pool(
+    inference_size: int = 100_000_000,
+    max_workers: int = 16,
+    num_runs: int = 3,
+    use_shared_memory: bool = False,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    task_size: Optional[int] = None,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
+    model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
 
     s = time.monotonic()
-    res = run_inference_process_pool(model=model, x_test=x_test)
-    print(f"Inference {max_workers} workers {time.monotonic() - s} result: {res.shape}")
+    with InferencePool(model=model, max_workers=max_workers) as pool:
+        print(f"Pool with {max_workers} workers warm in {time.monotonic() - s}")
+        batch_size = resolve_batch_size(
+            batch_size,
+            autotune,
+            backend=f"pool-{max_workers}",
+            run_fn=lambda x, bs: pool.run_inference(
+                x_test=x,
+                use_shared_memory=use_shared_memory,
+                batch_size=bs,
+                task_size=task_size,
+            ),
+            model=model,
+            x_test=x_test,
+        )
+        with trace_run(trace_path):
+            for run in range(num_runs):
+                s = time.monotonic()
+                res = pool.run_inference(
+                    x_test=x_test,
+                    use_shared_memory=use_shared_memory,
+                    batch_size=batch_size,
+                    task_size=task_size,
+                    out=out,
+                )
+                print(
+                    f"Inference run {run} {max_workers} warm workers {time.monotonic() - s} result: {res.shape}"
+                )
 
 
-def run_ray(inference_size: int = 100_000_000, max_workers: int = 16):
+def run_ray(
+    inference_size: int = 100_000_000,
+    max_workers: int = 16,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    task_size: Optional[int] = None,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    checkpoint_dir: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
     ray.init(include_dashboard=True, dashboard_host="127.0.0.1", dashboard_port=5000)
 
-    x_train, y_train, x_test = get_data(inference_size=inference_size)
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
     model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    checkpoint = open_checkpoint(checkpoint_dir, model, x_test)
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend=f"ray-{max_workers}",
+        run_fn=lambda x, bs: run_inference_ray_main(
+            model=model,
+            x_test=x,
+            max_workers=max_workers,
+            batch_size=bs,
+            task_size=task_size,
+        ),
+        model=model,
+        x_test=x_test,
+    )
 
-    s = time.monotonic()
-    res = run_inference_ray_main(model=model, x_test=x_test, max_workers=max_workers)
-    print(f"Inference with Ray {time.monotonic() - s} result: {res.shape}")
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = run_inference_ray_main(
+            model=model,
+            x_test=x_test,
+            max_workers=max_workers,
+            batch_size=batch_size,
+            task_size=task_size,
+            out=out,
+            checkpoint=checkpoint,
+        )
+        print(f"Inference with Ray {time.monotonic() - s} result: {res.shape}")
+
+
+def run_ray_actors(
+    inference_size: int = 100_000_000,
+    max_workers: int = 16,
+    slice_size: int = 100_000,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    ray.init(include_dashboard=True, dashboard_host="127.0.0.1", dashboard_port=5000)
+
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
+    model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend=f"ray-actors-{max_workers}",
+        run_fn=lambda x, bs: run_inference_ray_actors(
+            model=model,
+            x_test=x,
+            max_workers=max_workers,
+            slice_size=slice_size,
+            batch_size=bs,
+        ),
+        model=model,
+        x_test=x_test,
+    )
+
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = run_inference_ray_actors(
+            model=model,
+            x_test=x_test,
+            max_workers=max_workers,
+            slice_size=slice_size,
+            batch_size=batch_size,
+            out=out,
+        )
+        print(f"Inference with Ray actors {time.monotonic() - s} result: {res.shape}")
 
 
-def run_dask(inference_size: int = 100_000_000, max_workers: int = 16):
+def run_dask(
+    inference_size: int = 100_000_000,
+    max_workers: int = 16,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    task_size: Optional[int] = None,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
+    client = Client()
+
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
+    model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend=f"dask-{max_workers}",
+        run_fn=lambda x, bs: run_inference_dask_main(
+            client=client,
+            model=model,
+            x_test=x,
+            max_workers=max_workers,
+            batch_size=bs,
+            task_size=task_size,
+        ),
+        model=model,
+        x_test=x_test,
+    )
+
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = run_inference_dask_main(
+            client=client,
+            model=model,
+            x_test=x_test,
+            max_workers=max_workers,
+            batch_size=batch_size,
+            task_size=task_size,
+            out=out,
+        )
+        print(f"Inference with Dask {time.monotonic() - s} result: {res.shape}")
+
+
+def run_dask_array(
+    inference_size: int = 100_000_000,
+    chunk_size: int = 1_000_000,
+    batch_size: int = 2048,
+    autotune: bool = False,
+    data_path: Optional[str] = None,
+    output_path: Optional[str] = None,
+    trace_path: Optional[str] = None,
+):
     client = Client()
 
+    x_train, y_train, x_test = load_data(
+        inference_size=inference_size, data_path=data_path
+    )
+    model = train_model(x_train, y_train)
+    out = allocate_output(
+        model, x_test, output_path=default_output_path(x_test, output_path)
+    )
+    batch_size = resolve_batch_size(
+        batch_size,
+        autotune,
+        backend="dask-array",
+        run_fn=lambda x, bs: run_inference_dask_array(
+            client=client, model=model, x_test=x, chunk_size=chunk_size, batch_size=bs
+        ),
+        model=model,
+        x_test=x_test,
+    )
+
+    with trace_run(trace_path):
+        s = time.monotonic()
+        res = run_inference_dask_array(
+            client=client,
+            model=model,
+            x_test=x_test,
+            chunk_size=chunk_size,
+            batch_size=batch_size,
+            out=out,
+        )
+        print(f"Inference with Dask array {time.monotonic() - s} result: {res.shape}")
+
+
+BENCHMARK_BACKENDS = (
+    "single",
+    "concurrent",
+    "pool",
+    "shared-memory",
+    "ray",
+    "ray-actors",
+    "dask",
+    "dask-array",
+)
+
+
+@contextmanager
+def benchmark_backend(
+    backend: str, max_workers: int, task_size: Optional[int] = None
+) -> Iterator[Callable[[DummyClassifier, np.ndarray, int], np.ndarray]]:
+    if backend == "single":
+        yield lambda model, x, bs: run_inference(model, x, batch_size=bs)
+    elif backend == "concurrent":
+        yield lambda model, x, bs: run_inference_concurrent(
+            model, x, batch_size=bs, max_in_flight=max_workers
+        )
+    elif backend == "pool":
+        yield lambda model, x, bs: run_inference_process_pool(
+            model, x, max_workers=max_workers, batch_size=bs, task_size=task_size
+        )
+    elif backend == "shared-memory":
+        yield lambda model, x, bs: run_inference_process_pool_shared_memory(
+            model, x, max_workers=max_workers, batch_size=bs, task_size=task_size
+        )
+    elif backend == "ray":
+        ray.init(num_cpus=max_workers, include_dashboard=False)
+        try:
+            yield lambda model, x, bs: run_inference_ray_main(
+                model, x, max_workers=max_workers, batch_size=bs, task_size=task_size
+            )
+        finally:
+            ray.shutdown()
+    elif backend == "ray-actors":
+        ray.init(num_cpus=max_workers, include_dashboard=False)
+        try:
+            yield lambda model, x, bs: run_inference_ray_actors(
+                model, x, max_workers=max_workers, batch_size=bs
+            )
+        finally:
+            ray.shutdown()
+    elif backend == "dask":
+        with Client(n_workers=max_workers, threads_per_worker=1) as client:
+            yield lambda model, x, bs: run_inference_dask_main(
+                client,
+                model,
+                x,
+                max_workers=max_workers,
+                batch_size=bs,
+                task_size=task_size,
+            )
+    elif backend == "dask-array":
+        with Client(n_workers=max_workers, threads_per_worker=1) as client:
+            yield lambda model, x, bs: run_inference_dask_array(
+                client, model, x, batch_size=bs
+            )
+    else:
+        raise ValueError(f"Unknown backend {backend}, use one of {BENCHMARK_BACKENDS}")
+
+
+def serialization_overhead(
+    backend: str,
+    model: DummyClassifier,
+    x_test: np.ndarray,
+    max_workers: int,
+    task_size: Optional[int] = None,
+) -> Tuple[float, int]:
+    # pickle the per-task payload each backend ships to its workers
+    if backend in ("single", "concurrent"):
+        return 0.0, 0
+    if backend in ("ray-actors", "dask-array"):
+        # model and input are shipped to the cluster once
+        s = time.perf_counter()
+        num_bytes = len(pickle.dumps((model, x_test), protocol=pickle.HIGHEST_PROTOCOL))
+        return time.perf_counter() - s, num_bytes
+
+    num_bytes = 0
+    s = time.perf_counter()
+    for start, stop in split_tasks(len(x_test), max_workers, task_size):
+        if backend == "shared-memory":
+            payload = (model, (start, stop - start))
+        else:
+            payload = (model, x_test[start:stop])
+        num_bytes += len(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+    return time.perf_counter() - s, num_bytes
+
+
+def benchmark_config(
+    backend: str,
+    inference_size: int,
+    max_workers: int,
+    batch_size: int,
+    task_size: Optional[int] = None,
+    repeats: int = 1,
+    seed: int = 42,
+    result_path: Optional[str] = None,
+) -> dict:
+    np.random.seed(seed)
     x_train, y_train, x_test = get_data(inference_size=inference_size)
     model = train_model(x_train, y_train)
 
-    s = time.monotonic()
-    res = run_inference_dask_main(
-        client=client, model=model, x_test=x_test, max_workers=max_workers
+    times = []
+    with benchmark_backend(backend, max_workers, task_size) as run_fn:
+        for _ in range(repeats):
+            s = time.perf_counter()
+            run_fn(model, x_test, batch_size)
+            times.append(time.perf_counter() - s)
+
+    serialize_seconds, serialized_bytes = serialization_overhead(
+        backend, model, x_test, max_workers, task_size
     )
-    print(f"Inference with Dask {time.monotonic() - s} result: {res.shape}")
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    result = {
+        "backend": backend,
+        "inference_size": inference_size,
+        "max_workers": 1 if backend == "single" else max_workers,
+        "batch_size": batch_size,
+        "task_size": task_size,
+        "seconds": min(times),
+        "throughput": inference_size / min(times),
+        "peak_rss_mb": peak_rss,
+        "peak_child_rss_mb": peak_child_rss,
+        "serialize_seconds": serialize_seconds,
+        "serialized_mb": serialized_bytes / 2**20,
+    }
+    if result_path is not None:
+        Path(result_path).write_text(json.dumps(result))
+    return result
+
+
+def benchmark_markdown(results: List[dict]) -> str:
+    lines = [
+        "| Backend | Size | Workers | Batch size | Time (s) | Rows/s | Speedup | Peak RSS (MB) | Peak child RSS (MB) | Serialized (MB) | Serialize (s) |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['backend']} | {r['inference_size']} | {r['max_workers']} "
+            f"| {r['batch_size']} | {r['seconds']:.2f} | {r['throughput']:.0f} "
+            f"| {r['speedup']:.2f} | {r['peak_rss_mb']:.0f} "
+            f"| {r['peak_child_rss_mb']:.0f} | {r['serialized_mb']:.1f} "
+            f"| {r['serialize_seconds']:.3f} |"
+        )
+    return "\n".join(lines)
+
+
+def benchmark(
+    inference_size: List[int] = [10_000_000],
+    max_workers: List[int] = [16],
+    batch_size: List[int] = [2048],
+    backend: List[str] = ["single", "pool", "ray", "dask"],
+    task_size: Optional[int] = None,
+    repeats: int = 1,
+    seed: int = 42,
+    output_dir: str = "benchmark",
+):
+    configs = [
+        (name, size, workers, bs)
+        for size in inference_size
+        for bs in batch_size
+        for name in backend
+        # the single worker baseline does not depend on max_workers
+        for workers in (max_workers[:1] if name == "single" else max_workers)
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (name, size, workers, bs) in enumerate(configs):
+            print(f"Benchmark {name} size={size} workers={workers} batch_size={bs}")
+            # fresh interpreter per config, so peak RSS covers this config only
+            result_path = str(Path(tmp_dir, f"{i}.json"))
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "benchmark-config",
+                    name,
+                    str(size),
+                    str(workers),
+                    str(bs),
+                    *([f"--task-size={task_size}"] if task_size is not None else []),
+                    f"--repeats={repeats}",
+                    f"--seed={seed}",
+                    f"--result-path={result_path}",
+                ],
+                check=True,
+                env={**os.environ, "TQDM_DISABLE": "1"},
+            )
+            results.append(json.loads(Path(result_path).read_text()))
+
+    # speedup against the single worker run with the same size and batch size
+    baselines = {
+        (r["inference_size"], r["batch_size"]): r["seconds"]
+        for r in results
+        if r["backend"] == "single"
+    }
+    for r in results:
+        baseline = baselines.get((r["inference_size"], r["batch_size"]))
+        r["speedup"] = baseline / r["seconds"] if baseline else float("nan")
+
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "seed": seed,
+        "repeats": repeats,
+        "results": results,
+    }
+    table = benchmark_markdown(results)
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    Path(output_dir, "benchmark.json").write_text(json.dumps(report, indent=2))
+    Path(output_dir, "benchmark.md").write_text(table + "\n")
+    print(table)
 
 
 def cli_app():
     app = typer.Typer()
+    app.command()(write_data)
     app.command()(run_single_worker)
+    app.command()(run_concurrent)
     app.command()(run_pool)
+    app.command()(run_persistent_pool)
     app.command()(run_ray)
+    app.command()(run_ray_actors)
     app.command()(run_dask)
+    app.command()(run_dask_array)
+    app.command()(benchmark)
+    app.command(hidden=True)(benchmark_config)
     app()
 
 
@@ -1,44 +1,452 @@
-import random
+import hashlib
+import itertools
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
 
 import lancedb
+import numpy as np
+import pyarrow as pa
 import typer
 from datasets import load_dataset
 from sentence_transformers import SentenceTransformer
+from tqdm import tqdm
 
 app = typer.Typer()
 MODEL_NAME = "paraphrase-MiniLM-L3-v2"
+DATASET_NAME = "b-mc2/sql-create-context"
+RESULT_COLUMNS = ["answer", "context", "question"]
+CACHE_PATH = "cache/embeddings.sqlite"
+VECTOR_DTYPES = {"float32": pa.float32(), "float16": pa.float16()}
+FILTER_INDEXES = {
+    "id": "BTREE",
+    "table_names": "LABEL_LIST",
+    "column_names": "LABEL_LIST",
+}
+CREATE_TABLE = re.compile(
+    r"CREATE TABLE\s+[`\"]?(\w+)[`\"]?\s*\(([^)]*)\)", re.IGNORECASE
+)
+
+
+def table_schema(dim: int) -> pa.Schema:
+    return pa.schema(
+        [
+            pa.field("id", pa.int64()),
+            pa.field("text", pa.string()),
+            pa.field("vector", pa.list_(pa.float32(), dim)),
+            pa.field("answer", pa.string()),
+            pa.field("question", pa.string()),
+            pa.field("context", pa.string()),
+            pa.field("content_hash", pa.string()),
+            pa.field("table_names", pa.list_(pa.string())),
+            pa.field("column_names", pa.list_(pa.string())),
+        ]
+    )
+
+
+def context_schema(context: str) -> Tuple[List[str], List[str]]:
+    """Table and column names declared by the CREATE TABLE statements."""
+    tables = set()
+    columns = set()
+    for table, definitions in CREATE_TABLE.findall(context):
+        tables.add(table.lower())
+        columns.update(
+            definition.split()[0].strip('`"').lower()
+            for definition in definitions.split(",")
+            if definition.strip()
+        )
+    return sorted(tables), sorted(columns)
+
+
+def sql_list(values: Iterable[str]) -> str:
+    return (
+        "[" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + "]"
+    )
+
+
+def search_filter(
+    sql_tables: Sequence[str] = (),
+    sql_columns: Sequence[str] = (),
+    where: Optional[str] = None,
+) -> Optional[str]:
+    """SQL predicate on the filter columns, evaluated before the vector search."""
+    clauses = []
+    if sql_tables:
+        tables = sql_list(table.lower() for table in sql_tables)
+        clauses.append(f"array_has_any(table_names, {tables})")
+    if sql_columns:
+        columns = sql_list(column.lower() for column in sql_columns)
+        clauses.append(f"array_has_all(column_names, {columns})")
+    if where:
+        clauses.append(f"({where})")
+    return " AND ".join(clauses) or None
+
+
+def create_filter_indexes(table) -> None:
+    # scalar indexes let the pre-filter skip a full scan of the filter columns
+    for column, index_type in FILTER_INDEXES.items():
+        table.create_scalar_index(column, index_type=index_type, replace=True)
+
+
+def document_hash(question: str, answer: str, context: str) -> str:
+    return hashlib.sha256("\0".join((question, answer, context)).encode()).hexdigest()
+
+
+def batch_vectors(data) -> np.ndarray:
+    vectors = data.column("vector")
+    if isinstance(vectors, pa.ChunkedArray):
+        vectors = vectors.combine_chunks()
+    values = vectors.flatten().to_numpy(zero_copy_only=False)
+    return values.reshape(len(vectors), -1)
+
+
+class VectorQuantizer:
+    """Converts float32 embeddings to the vector type stored in the table.
+
+    The dtype is kept in the schema metadata. int8 scalar quantization lives in
+    the vector index instead (``--index-type IVF_SQ``), since LanceDB cannot
+    index integer vectors.
+    """
+
+    def __init__(self, dtype: str = "float32"):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"vector dtype must be one of {list(VECTOR_DTYPES)}")
+        self.dtype = dtype
+
+    @classmethod
+    def from_schema(cls, schema: pa.Schema) -> "VectorQuantizer":
+        metadata = schema.metadata or {}
+        return cls(metadata.get(b"vector_dtype", b"float32").decode())
+
+    def schema(self, schema: pa.Schema) -> pa.Schema:
+        dim = schema.field("vector").type.list_size
+        schema = schema.set(
+            schema.get_field_index("vector"),
+            pa.field("vector", pa.list_(VECTOR_DTYPES[self.dtype], dim)),
+        )
+        return schema.with_metadata({"vector_dtype": self.dtype})
+
+    def quantize(self, batch: pa.RecordBatch) -> pa.RecordBatch:
+        if self.dtype == "float32":
+            return batch
+        vectors = batch_vectors(batch).astype(self.dtype)
+        columns = batch.columns
+        columns[batch.schema.get_field_index("vector")] = (
+            pa.FixedSizeListArray.from_arrays(
+                pa.array(vectors.ravel()), vectors.shape[1]
+            )
+        )
+        return pa.RecordBatch.from_arrays(columns, schema=self.schema(batch.schema))
+
+
+class EmbeddingCache:
+    """On-disk embeddings keyed by hash(model name, text)."""
+
+    def __init__(self, path: str, model_name: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # LanceDB pulls record batches (and so cache lookups) from its own thread
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        # query-batch searches share the connection across threads
+        self.lock = threading.Lock()
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(set(keys))
+        # stay under SQLite's bound parameter limit
+        for i in range(0, len(unique), 500):
+            chunk = unique[i : i + 500]
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT key, vector FROM embeddings "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            found.update(
+                (key, np.frombuffer(vector, np.float32)) for key, vector in rows
+            )
+        return found
+
+    def put_many(self, keys: Sequence[str], vectors: np.ndarray) -> None:
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in zip(keys, vectors)],
+            )
+            self.conn.commit()
+
+
+@contextmanager
+def encoding_pool(
+    model: SentenceTransformer, num_workers: int = 1
+) -> Iterator[Optional[dict]]:
+    if num_workers <= 1:
+        yield None
+        return
+    # split the cores between workers instead of each one using all of them,
+    # workers inherit the variable when they start
+    omp_num_threads = os.environ.get("OMP_NUM_THREADS")
+    os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // num_workers))
+    try:
+        pool = model.start_multi_process_pool(["cpu"] * num_workers)
+        try:
+            yield pool
+        finally:
+            model.stop_multi_process_pool(pool)
+    finally:
+        if omp_num_threads is None:
+            os.environ.pop("OMP_NUM_THREADS", None)
+        else:
+            os.environ["OMP_NUM_THREADS"] = omp_num_threads
+
+
+def embed(
+    model: SentenceTransformer,
+    texts: List[str],
+    pool: Optional[dict] = None,
+    chunk_size: Optional[int] = None,
+) -> np.ndarray:
+    if pool is None:
+        return np.asarray(model.encode(texts), dtype=np.float32)
+
+    # sort by length so every worker chunk pads to similar lengths
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    embeddings = model.encode_multi_process(
+        [texts[i] for i in order], pool, chunk_size=chunk_size
+    )
+    out = np.empty(embeddings.shape, dtype=np.float32)
+    out[order] = embeddings
+    return out
+
+
+def encode_texts(
+    model: SentenceTransformer,
+    texts: List[str],
+    cache: Optional[EmbeddingCache] = None,
+    pool: Optional[dict] = None,
+    chunk_size: Optional[int] = None,
+) -> np.ndarray:
+    if cache is None:
+        return embed(model, texts, pool, chunk_size)
+
+    keys = [cache.key(text) for text in texts]
+    found = cache.get_many(keys)
+    # encode each missing text once, even if it repeats within the batch
+    missing = {key: text for key, text in zip(keys, texts) if key not in found}
+    if missing:
+        vectors = embed(model, list(missing.values()), pool, chunk_size)
+        cache.put_many(list(missing), vectors)
+        found.update(zip(missing, vectors))
+    cache.hits += len(keys) - len(missing)
+    cache.misses += len(missing)
+    return np.stack([found[key] for key in keys])
+
+
+def dataset_size(dataset) -> int:
+    splits = dataset.info.splits
+    if splits and splits.get("train") and splits["train"].num_examples:
+        return splits["train"].num_examples
+    # count the rows in one pass when the dataset card does not say
+    return sum(
+        len(batch["question"])
+        for batch in dataset.select_columns(["question"]).iter(batch_size=10_000)
+    )
+
+
+def iter_document_batches(
+    number_of_documents: int, batch_size: int, seed: int = 42
+) -> Iterator[dict]:
+    """Stream a uniform sample of the dataset, drawn by row id with ``seed``.
+
+    The same seed gives the same rows, so ``update`` syncs the rows that
+    ``create-new-vector-db`` indexed.
+    """
+    dataset = load_dataset(DATASET_NAME, split="train", streaming=True)
+    num_rows = dataset_size(dataset)
+    # only the drawn ids are held in memory, documents stream through
+    keep = set(
+        np.random.default_rng(seed)
+        .choice(num_rows, size=min(number_of_documents, num_rows), replace=False)
+        .tolist()
+    )
+    # ids are source row positions, so updates can match rows to the table
+    dataset = dataset.map(lambda doc, idx: {"id": idx}, with_indices=True)
+    dataset = dataset.filter(lambda doc: doc["id"] in keep)
+    yield from dataset.take(len(keep)).iter(batch_size=batch_size)
+
+
+def encode_batches(
+    model: SentenceTransformer,
+    batches: Iterable[dict],
+    schema: pa.Schema,
+    cache: Optional[EmbeddingCache] = None,
+    pool: Optional[dict] = None,
+    chunk_size: Optional[int] = None,
+) -> Iterator[pa.RecordBatch]:
+    dim = schema.field("vector").type.list_size
+    for docs in batches:
+        texts = docs["question"]
+        embeddings = encode_texts(model, texts, cache, pool, chunk_size)
+        tables, columns = zip(*map(context_schema, docs["context"]))
+        yield pa.record_batch(
+            [
+                pa.array(docs["id"], pa.int64()),
+                pa.array(texts),
+                pa.FixedSizeListArray.from_arrays(pa.array(embeddings.ravel()), dim),
+                pa.array(docs["answer"]),
+                pa.array(docs["question"]),
+                pa.array(docs["context"]),
+                pa.array(
+                    [
+                        document_hash(*row)
+                        for row in zip(
+                            docs["question"], docs["answer"], docs["context"]
+                        )
+                    ]
+                ),
+                pa.array(tables, pa.list_(pa.string())),
+                pa.array(columns, pa.list_(pa.string())),
+            ],
+            schema=schema,
+        )
 
 
 @app.command()
 def create_new_vector_db(
-    table_name: str = "my-rag-app", number_of_documents: int = 1000, uri=".lancedb"
+    table_name: str = "my-rag-app",
+    number_of_documents: int = 1000,
+    uri=".lancedb",
+    batch_size: int = 1024,
+    cache_path: str = CACHE_PATH,
+    num_workers: int = 1,
+    chunk_size: Optional[int] = None,
+    vector_dtype: str = "float32",
+    index_type: str = "IVF_PQ",
+    seed: int = 42,
 ):
-    dataset = load_dataset("b-mc2/sql-create-context")
     model = SentenceTransformer(MODEL_NAME)
+    cache = EmbeddingCache(cache_path, MODEL_NAME)
+    schema = table_schema(model.get_sentence_embedding_dimension())
 
-    docs = random.sample(list(dataset["train"]), k=number_of_documents)
+    batches = tqdm(
+        iter_document_batches(number_of_documents, batch_size, seed),
+        total=-(-number_of_documents // batch_size),
+        unit="batch",
+    )
 
-    texts = [doc["question"] for doc in docs]
-    embeddings = model.encode(texts, show_progress_bar=True)
+    quantizer = VectorQuantizer(vector_dtype)
+    db = lancedb.connect(uri)
+    with encoding_pool(model, num_workers) as pool:
+        data = encode_batches(model, batches, schema, cache, pool, chunk_size)
+        # record batches are appended as they are encoded, so memory stays
+        # bounded by batch_size instead of the dataset size
+        lance_table = db.create_table(
+            table_name,
+            data=map(quantizer.quantize, data),
+            schema=quantizer.schema(schema),
+        )
+    lance_table.create_index(index_type=index_type)
+    create_filter_indexes(lance_table)
 
-    data = [
-        {
-            "id": idx,
-            "text": texts[idx],
-            "vector": embeddings[idx],
-            "answer": docs[idx]["answer"],
-            "question": docs[idx]["question"],
-            "context": docs[idx]["context"],
-        }
-        for idx in range(len(texts))
-    ]
+    typer.echo(
+        f"Lance table {table_name} created with {lance_table.count_rows()} documents "
+        f"({cache.hits} cached, {cache.misses} encoded)."
+    )
 
-    db = lancedb.connect(uri)
-    lance_table = db.create_table(table_name, data=data)
-    lance_table.create_index()
+
+@app.command()
+def update(
+    table_name: str = "my-rag-app",
+    number_of_documents: int = 1000,
+    uri=".lancedb",
+    batch_size: int = 1024,
+    cache_path: str = CACHE_PATH,
+    num_workers: int = 1,
+    chunk_size: Optional[int] = None,
+    seed: int = 42,
+):
+    """Sync the table with the source, encoding only new or changed rows."""
+    model = SentenceTransformer(MODEL_NAME)
+    cache = EmbeddingCache(cache_path, MODEL_NAME)
+    tbl = lancedb.connect(uri).open_table(table_name)
+    quantizer = VectorQuantizer.from_schema(tbl.schema)
+    schema = table_schema(tbl.schema.field("vector").type.list_size)
+
+    # read ids and hashes only, vectors stay on disk
+    existing = (
+        tbl.search().select(["id", "content_hash"]).limit(tbl.count_rows()).to_arrow()
+    )
+    existing_hashes = dict(
+        zip(existing["id"].to_pylist(), existing["content_hash"].to_pylist())
+    )
+
+    seen = set()
+    added = updated = 0
+    batches = tqdm(
+        iter_document_batches(number_of_documents, batch_size, seed),
+        total=-(-number_of_documents // batch_size),
+        unit="batch",
+    )
+    with encoding_pool(model, num_workers) as pool:
+        for docs in batches:
+            seen.update(docs["id"])
+            changed = [
+                i
+                for i, row in enumerate(
+                    zip(docs["id"], docs["question"], docs["answer"], docs["context"])
+                )
+                if existing_hashes.get(row[0]) != document_hash(*row[1:])
+            ]
+            if not changed:
+                continue
+            new = sum(docs["id"][i] not in existing_hashes for i in changed)
+            added += new
+            updated += len(changed) - new
+
+            changed_docs = {
+                column: [docs[column][i] for i in changed] for column in docs
+            }
+            batch = next(
+                encode_batches(model, [changed_docs], schema, cache, pool, chunk_size)
+            )
+            (
+                tbl.merge_insert("id")
+                .when_matched_update_all()
+                .when_not_matched_insert_all()
+                .execute(pa.Table.from_batches([quantizer.quantize(batch)]))
+            )
+
+    deleted = [doc_id for doc_id in existing_hashes if doc_id not in seen]
+    for i in range(0, len(deleted), 1000):
+        tbl.delete(f"id IN ({', '.join(map(str, deleted[i : i + 1000]))})")
+
+    if added or updated or deleted:
+        # compact and add the new rows to the vector index
+        tbl.optimize()
 
     typer.echo(
-        f"Lance table {table_name} created with {number_of_documents} documents."
+        f"Lance table {table_name}: {added} added, {updated} updated, "
+        f"{len(deleted)} deleted, {len(seen) - added - updated} unchanged "
+        f"({cache.hits} cached, {cache.misses} encoded)."
     )
 
 
@@ -48,14 +456,24 @@ def query_existing_vector_db(
     table_name: str = "my-rag-app",
     top_n: int = 1,
     uri=".lancedb",
+    refine_factor: int = 4,
+    cache_path: str = CACHE_PATH,
+    sql_table: List[str] = [],
+    sql_column: List[str] = [],
+    where: Optional[str] = None,
 ):
     model = SentenceTransformer(MODEL_NAME)
     query_embedding = model.encode(query)
 
     db = lancedb.connect(uri)
     tbl = db.open_table(table_name)
+    searcher = VectorSearch(
+        tbl, model, EmbeddingCache(cache_path, MODEL_NAME), refine_factor
+    )
 
-    results = tbl.search(query_embedding).limit(top_n).to_list()
+    results = searcher.search(
+        query_embedding, top_n, where=search_filter(sql_table, sql_column, where)
+    )
     typer.echo("Search result:")
     for result in results:
         typer.echo("RESULT")
@@ -64,5 +482,621 @@ def query_existing_vector_db(
         typer.echo(result["question"])
 
 
+class VectorSearch:
+    """Searches the vector index, reranking candidates at higher precision.
+
+    LanceDB re-scores ``refine_factor`` times more index candidates against the
+    stored vectors. For float16 tables those candidates are then reranked in
+    float32, with vectors read from the embedding cache or re-encoded from the
+    candidate text when the cache does not have them.
+    """
+
+    def __init__(
+        self,
+        table,
+        model: SentenceTransformer,
+        cache: Optional[EmbeddingCache] = None,
+        refine_factor: int = 4,
+    ):
+        self.table = table
+        self.model = model
+        self.cache = cache
+        self.refine_factor = refine_factor
+        self.quantizer = VectorQuantizer.from_schema(table.schema)
+
+    def search(
+        self,
+        embedding: np.ndarray,
+        top_n: int,
+        columns: List[str] = RESULT_COLUMNS,
+        where: Optional[str] = None,
+    ) -> List[dict]:
+        rerank = self.quantizer.dtype != "float32" and self.refine_factor > 1
+        limit = top_n * self.refine_factor if rerank else top_n
+        selected = list(dict.fromkeys([*columns, "text"])) if rerank else columns
+        query = self.table.search(embedding)
+        if self.refine_factor > 1:
+            query = query.refine_factor(self.refine_factor)
+        if where:
+            # pre-filter, so a selective filter still fills the top-k
+            query = query.where(where, prefilter=True)
+        # project the result columns so the stored vectors are never read back
+        rows = query.select(selected).limit(limit).to_list()
+
+        distances = [row["_distance"] for row in rows]
+        order = range(len(rows))
+        if rerank and rows:
+            # float32 vectors come from the embedding cache, missing ones are
+            # re-encoded from the candidate text
+            vectors = encode_texts(
+                self.model, [row["text"] for row in rows], self.cache
+            )
+            distances = ((vectors - embedding) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind="stable")[:top_n]
+        return [
+            {
+                **{column: rows[i][column] for column in columns},
+                "distance": float(distances[i]),
+            }
+            for i in order
+        ]
+
+
+def record_filter(record: dict) -> Optional[str]:
+    return search_filter(
+        record.get("sql_tables", ()), record.get("sql_columns", ()), record.get("where")
+    )
+
+
+@app.command()
+def query_batch(
+    input_path: str,
+    output_path: str,
+    table_name: str = "my-rag-app",
+    top_n: int = 1,
+    uri=".lancedb",
+    batch_size: int = 1024,
+    max_workers: int = 8,
+    refine_factor: int = 4,
+    cache_path: str = CACHE_PATH,
+):
+    """Answer a JSONL file of {"query": ...} records, writing results as JSONL.
+
+    Records may restrict results with "sql_tables", "sql_columns" and "where".
+    """
+    model = SentenceTransformer(MODEL_NAME)
+    tbl = lancedb.connect(uri).open_table(table_name)
+    searcher = VectorSearch(
+        tbl, model, EmbeddingCache(cache_path, MODEL_NAME), refine_factor
+    )
+
+    with (
+        open(input_path) as source,
+        open(output_path, "w") as sink,
+        ThreadPoolExecutor(max_workers=max_workers) as executor,
+        tqdm(unit="query") as progress,
+    ):
+        records = (json.loads(line) for line in source if line.strip())
+        while batch := list(itertools.islice(records, batch_size)):
+            # one encode call per batch, searches run concurrently
+            embeddings = model.encode([record["query"] for record in batch])
+            top_ns = [record.get("top_n", top_n) for record in batch]
+            wheres = [record_filter(record) for record in batch]
+            results = executor.map(
+                searcher.search,
+                embeddings,
+                top_ns,
+                itertools.repeat(RESULT_COLUMNS),
+                wheres,
+            )
+            for record, rows in zip(batch, results):
+                sink.write(json.dumps({**record, "results": rows}) + "\n")
+            progress.update(len(batch))
+    typer.echo(f"Wrote {progress.n} answers to {output_path}")
+
+
+class QueryBatcher:
+    """Collects concurrent queries and encodes each batch in one model call.
+
+    Only encoding runs on the batching thread, the searches of a batch run on
+    a thread pool so the next batch can be collected meanwhile.
+    """
+
+    def __init__(
+        self,
+        model: SentenceTransformer,
+        searcher: VectorSearch,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_workers: int = 8,
+    ):
+        self.model = model
+        self.searcher = searcher
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.queue: queue.Queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, query: str, top_n: int = 1, where: Optional[str] = None) -> Future:
+        future: Future = Future()
+        self.queue.put((time.perf_counter(), query, top_n, where, future))
+        return future
+
+    def next_batch(self) -> List[Tuple[float, str, int, Optional[str], Future]]:
+        # block for the first query, then wait up to max_wait for company
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            try:
+                embeddings = self.model.encode([query for _, query, *_ in batch])
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            encoded = time.perf_counter()
+
+            for request, embedding in zip(batch, embeddings):
+                self.executor.submit(
+                    self.search, request, embedding, len(batch), started, encoded
+                )
+
+    def search(
+        self,
+        request: Tuple[float, str, int, Optional[str], Future],
+        embedding: np.ndarray,
+        batch_size: int,
+        started: float,
+        encoded: float,
+    ) -> None:
+        submitted, query, top_n, where, future = request
+        try:
+            s = time.perf_counter()
+            results = self.searcher.search(embedding, top_n, where=where)
+            done = time.perf_counter()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        future.set_result(
+            {
+                "query": query,
+                "results": results,
+                "batch_size": batch_size,
+                "latency_ms": {
+                    "queue": (started - submitted) * 1e3,
+                    "encode": (encoded - started) * 1e3,
+                    "search": (done - s) * 1e3,
+                    "total": (done - submitted) * 1e3,
+                },
+            }
+        )
+
+
+def log_latency(response: dict) -> None:
+    latency = response["latency_ms"]
+    typer.echo(
+        f"{latency['total']:.1f}ms (queue {latency['queue']:.1f}, "
+        f"encode {latency['encode']:.1f}, search {latency['search']:.1f}) "
+        f"batch={response['batch_size']} query={response['query']!r}",
+        err=True,
+    )
+
+
+def make_handler(batcher: QueryBatcher, default_top_n: int):
+    class SearchHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if url.path != "/search" or "query" not in params:
+                self.send_error(
+                    404, "Use GET /search?query=...&top_n=...&sql_table=...&where=..."
+                )
+                return
+            try:
+                top_n = int(params.get("top_n", [default_top_n])[0])
+            except ValueError:
+                self.send_error(400, "top_n must be an integer")
+                return
+            where = search_filter(
+                params.get("sql_table", []),
+                params.get("sql_column", []),
+                params.get("where", [None])[0],
+            )
+            try:
+                response = batcher.submit(params["query"][0], top_n, where).result()
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            log_latency(response)
+            body = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # per-query latency is logged instead of the access log
+            pass
+
+    return SearchHandler
+
+
+def write_responses(futures: queue.Queue) -> None:
+    # print answers in input order while later queries are still being batched
+    while (item := futures.get()) is not None:
+        query, future = item
+        try:
+            response = future.result()
+        except Exception as e:
+            # a failed query gets an error record, the rest keep flowing
+            typer.echo(json.dumps({"query": query, "error": str(e)}))
+            continue
+        log_latency(response)
+        typer.echo(json.dumps(response))
+
+
+@app.command()
+def serve(
+    table_name: str = "my-rag-app",
+    top_n: int = 1,
+    uri=".lancedb",
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    stdin: bool = False,
+    max_batch_size: int = 64,
+    max_wait_ms: float = 5.0,
+    max_workers: int = 8,
+    refine_factor: int = 4,
+    cache_path: str = CACHE_PATH,
+):
+    """Keep the encoder and table warm and answer queries over HTTP or stdin."""
+    model = SentenceTransformer(MODEL_NAME)
+    tbl = lancedb.connect(uri).open_table(table_name)
+    searcher = VectorSearch(
+        tbl, model, EmbeddingCache(cache_path, MODEL_NAME), refine_factor
+    )
+    batcher = QueryBatcher(
+        model,
+        searcher,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        max_workers=max_workers,
+    )
+    batcher.submit("warmup", top_n).result()
+
+    if stdin:
+        # one query per line, plain text or a query-batch style JSON record
+        futures: queue.Queue = queue.Queue()
+        writer = threading.Thread(target=write_responses, args=(futures,))
+        writer.start()
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            query = line
+            try:
+                request = json.loads(line) if line.startswith("{") else {"query": line}
+                query = request["query"]
+                future = batcher.submit(
+                    query, int(request.get("top_n", top_n)), record_filter(request)
+                )
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            futures.put((query, future))
+        futures.put(None)
+        writer.join()
+        return
+
+    server = ThreadingHTTPServer((host, port), make_handler(batcher, top_n))
+    typer.echo(f"Serving {table_name} on http://{host}:{port}/search?query=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def held_out_questions(table_ids: set, num_queries: int) -> List[str]:
+    # questions from source rows that are not in the table
+    dataset = load_dataset(DATASET_NAME, split="train", streaming=True)
+    dataset = dataset.map(lambda doc, idx: {"id": idx}, with_indices=True)
+    held_out = dataset.filter(lambda doc: doc["id"] not in table_ids)
+    return [doc["question"] for doc in held_out.take(num_queries)]
+
+
+def timed_search(
+    table,
+    queries: np.ndarray,
+    k: int,
+    configure: Callable = lambda query: query,
+) -> Tuple[List[List[int]], np.ndarray]:
+    ids = []
+    latencies = []
+    for query in queries:
+        s = time.perf_counter()
+        rows = configure(table.search(query).select(["id"]).limit(k)).to_arrow()
+        latencies.append(time.perf_counter() - s)
+        ids.append(rows["id"].to_pylist())
+    return ids, np.array(latencies) * 1e3
+
+
+def recall_at_k(found_ids: List[List[int]], exact_ids: List[List[int]]) -> float:
+    return float(
+        np.mean(
+            [
+                len(set(found) & set(exact)) / max(len(exact), 1)
+                for found, exact in zip(found_ids, exact_ids)
+            ]
+        )
+    )
+
+
+def index_variants(
+    index_types: List[str],
+    num_partitions: List[int],
+    num_sub_vectors: List[int],
+    dim: int,
+    num_rows: int,
+) -> Iterator[dict]:
+    for index_type in index_types:
+        for partitions in num_partitions:
+            if partitions > num_rows:
+                typer.echo(f"Skip {index_type} with {partitions} partitions > rows")
+                continue
+            if "PQ" not in index_type:
+                yield {"index_type": index_type, "num_partitions": partitions}
+                continue
+            for sub_vectors in num_sub_vectors:
+                if dim % sub_vectors:
+                    typer.echo(f"Skip {sub_vectors} sub-vectors, dim {dim}")
+                    continue
+                yield {
+                    "index_type": index_type,
+                    "num_partitions": partitions,
+                    "num_sub_vectors": sub_vectors,
+                }
+
+
+def index_benchmark_markdown(results: List[dict], k: int) -> str:
+    lines = [
+        f"| Index | Partitions | Sub-vectors | nprobes | Refine | ef | Build (s) | Recall@{k} | p50 (ms) | p99 (ms) |",
+        "|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['index_type']} | {r.get('num_partitions', '-')} "
+            f"| {r.get('num_sub_vectors', '-')} | {r.get('nprobes', '-')} "
+            f"| {r.get('refine_factor') or '-'} | {r.get('ef') or '-'} "
+            f"| {r['build_s']:.2f} | {r['recall']:.3f} "
+            f"| {r['p50_ms']:.2f} | {r['p99_ms']:.2f} |"
+        )
+    return "\n".join(lines)
+
+
+@app.command()
+def bench_index(
+    table_name: str = "my-rag-app",
+    uri=".lancedb",
+    k: int = 10,
+    num_queries: int = 200,
+    index_type: List[str] = ["IVF_PQ", "IVF_HNSW_SQ"],
+    num_partitions: List[int] = [64, 256],
+    num_sub_vectors: List[int] = [16, 48],
+    nprobes: List[int] = [10, 20, 50],
+    refine_factor: List[int] = [0, 5],
+    ef: List[int] = [0],
+    output_dir: str = "benchmark",
+):
+    """Sweep ANN index parameters, reporting recall@k and latency vs exact search."""
+    model = SentenceTransformer(MODEL_NAME)
+    db = lancedb.connect(uri)
+    tbl = db.open_table(table_name)
+    num_rows = tbl.count_rows()
+
+    # index a copy with ids and vectors only, the source table keeps its index
+    bench_name = f"{table_name}-bench-index"
+    bench = db.create_table(
+        bench_name,
+        data=tbl.search().select(["id", "vector"]).limit(num_rows).to_batches(),
+        mode="overwrite",
+    )
+    dim = bench.schema.field("vector").type.list_size
+
+    table_ids = set(
+        tbl.search().select(["id"]).limit(num_rows).to_arrow()["id"].to_pylist()
+    )
+    queries = model.encode(held_out_questions(table_ids, num_queries))
+    typer.echo(f"{len(queries)} held-out queries against {num_rows} rows")
+
+    exact_ids, latencies = timed_search(
+        bench, queries, k, lambda query: query.bypass_vector_index()
+    )
+    results = [
+        {
+            "index_type": "exact",
+            "build_s": 0.0,
+            "recall": 1.0,
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+        }
+    ]
+
+    for variant in index_variants(
+        index_type, num_partitions, num_sub_vectors, dim, num_rows
+    ):
+        s = time.perf_counter()
+        bench.create_index(replace=True, **variant)
+        build_s = time.perf_counter() - s
+
+        hnsw_ef = ef if "HNSW" in variant["index_type"] else [0]
+        for probes, refine, search_ef in itertools.product(
+            nprobes, refine_factor, hnsw_ef
+        ):
+
+            def configure(query, probes=probes, refine=refine, search_ef=search_ef):
+                query = query.nprobes(probes)
+                if refine:
+                    query = query.refine_factor(refine)
+                if search_ef:
+                    query = query.ef(search_ef)
+                return query
+
+            found_ids, latencies = timed_search(bench, queries, k, configure)
+            recall = recall_at_k(found_ids, exact_ids)
+            results.append(
+                {
+                    **variant,
+                    "nprobes": probes,
+                    "refine_factor": refine,
+                    "ef": search_ef,
+                    "build_s": build_s,
+                    "recall": float(recall),
+                    "p50_ms": float(np.percentile(latencies, 50)),
+                    "p99_ms": float(np.percentile(latencies, 99)),
+                }
+            )
+            typer.echo(
+                f"{variant} nprobes={probes} refine={refine} ef={search_ef}: "
+                f"recall@{k}={recall:.3f} p50={results[-1]['p50_ms']:.2f}ms "
+                f"p99={results[-1]['p99_ms']:.2f}ms"
+            )
+    db.drop_table(bench_name)
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    (output / "index_benchmark.json").write_text(json.dumps(results, indent=2))
+    markdown = index_benchmark_markdown(results, k)
+    (output / "index_benchmark.md").write_text(markdown + "\n")
+    typer.echo(markdown)
+
+
+def vector_index_mb(table) -> float:
+    return (
+        sum(
+            index.size_bytes
+            for index in table.list_indices()
+            if index.columns == ["vector"]
+        )
+        / 2**20
+    )
+
+
+def quantization_benchmark_markdown(results: List[dict], k: int) -> str:
+    lines = [
+        f"| Storage | Index | Refine | Vectors (MB) | Index (MB) | Recall@{k} "
+        "| p50 (ms) | p99 (ms) |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for r in results:
+        lines.append(
+            f"| {r['vector_dtype']} | {r['index_type']} | {r['refine_factor'] or '-'} "
+            f"| {r['vectors_mb']:.2f} | {r['index_mb']:.2f} | {r['recall']:.3f} "
+            f"| {r['p50_ms']:.2f} | {r['p99_ms']:.2f} |"
+        )
+    return "\n".join(lines)
+
+
+@app.command()
+def bench_quantization(
+    table_name: str = "my-rag-app",
+    uri=".lancedb",
+    k: int = 10,
+    num_queries: int = 200,
+    vector_dtype: List[str] = ["float32", "float16"],
+    index_type: List[str] = ["IVF_PQ", "IVF_SQ"],
+    refine_factor: List[int] = [1, 4],
+    cache_path: str = CACHE_PATH,
+    output_dir: str = "benchmark",
+):
+    """Compare footprint and recall@k of reduced-precision copies of a float32 table."""
+    model = SentenceTransformer(MODEL_NAME)
+    cache = EmbeddingCache(cache_path, MODEL_NAME)
+    db = lancedb.connect(uri)
+    tbl = db.open_table(table_name)
+    if VectorQuantizer.from_schema(tbl.schema).dtype != "float32":
+        raise ValueError(f"{table_name} is already quantized, use a float32 table")
+    num_rows = tbl.count_rows()
+    dim = tbl.schema.field("vector").type.list_size
+
+    table_ids = set(
+        tbl.search().select(["id"]).limit(num_rows).to_arrow()["id"].to_pylist()
+    )
+    queries = model.encode(held_out_questions(table_ids, num_queries))
+    typer.echo(f"{len(queries)} held-out queries against {num_rows} rows")
+    exact_ids, _ = timed_search(
+        tbl, queries, k, lambda query: query.bypass_vector_index()
+    )
+
+    results = []
+    for dtype in vector_dtype:
+        batches = iter(
+            tbl.search().select(["id", "text", "vector"]).limit(num_rows).to_batches()
+        )
+        first = next(batches)
+        quantizer = VectorQuantizer(dtype)
+        bench_name = f"{table_name}-bench-{dtype}"
+        bench = db.create_table(
+            bench_name,
+            data=map(quantizer.quantize, itertools.chain([first], batches)),
+            schema=quantizer.schema(first.schema),
+            mode="overwrite",
+        )
+        vectors_mb = num_rows * dim * VECTOR_DTYPES[dtype].bit_width / 8 / 2**20
+
+        for index in index_type:
+            bench.create_index(index_type=index, replace=True)
+            index_mb = vector_index_mb(bench)
+            for refine in refine_factor:
+                searcher = VectorSearch(bench, model, cache, refine)
+                found_ids = []
+                latencies = []
+                for query in queries:
+                    s = time.perf_counter()
+                    rows = searcher.search(query, k, columns=["id"])
+                    latencies.append((time.perf_counter() - s) * 1e3)
+                    found_ids.append([row["id"] for row in rows])
+                results.append(
+                    {
+                        "vector_dtype": dtype,
+                        "index_type": index,
+                        "refine_factor": refine,
+                        "vectors_mb": vectors_mb,
+                        "index_mb": index_mb,
+                        "recall": recall_at_k(found_ids, exact_ids),
+                        "p50_ms": float(np.percentile(latencies, 50)),
+                        "p99_ms": float(np.percentile(latencies, 99)),
+                    }
+                )
+                typer.echo(
+                    f"{dtype} {index} refine={refine}: {vectors_mb:.2f}MB vectors, "
+                    f"{index_mb:.2f}MB index, recall@{k}={results[-1]['recall']:.3f} "
+                    f"p50={results[-1]['p50_ms']:.2f}ms"
+                )
+        db.drop_table(bench_name)
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    (output / "quantization_benchmark.json").write_text(json.dumps(results, indent=2))
+    markdown = quantization_benchmark_markdown(results, k)
+    (output / "quantization_benchmark.md").write_text(markdown + "\n")
+    typer.echo(markdown)
+
+
 if __name__ == "__main__":
     app()